@@ -2,17 +2,44 @@
 
 import argparse
 import ast
+import bz2
 import configparser
+import csv
+import gzip
+import io
 import json
+import lzma
+import math
 import multiprocessing
 import os
+import queue
 import random
 import re
+import shutil
+import sys
+import threading
 import time
 import uuid
+import zipfile
+import zlib
 import logging
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from functools import partial
+from itertools import chain, count
+import datagen_clear as clear
 import datagen_exceptions as exc
+import datagen_faker as faker_pools
+import datagen_manifest as manifests
+import datagen_metrics as metrics
+import datagen_profile as profile
+import datagen_stats as stats
+import datagen_verify as verify
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def parsing():
@@ -51,11 +78,114 @@ def parsing():
                             help=f"Number of lines with data in each file. "
                                  f"Default value = {int(config['def_val']['data_lines'])}")
         parser.add_argument("--clear_path", action='store_true',
-                            help='If used, all jsonl files in the directory specified by path_to_save_files, '
-                                 'containing file_name in their name will be deleted before creating new ones.')
-        parser.add_argument("--multiprocessing", default=int(config['def_val']['multiprocessing']), type=int,
-                            help=f"Number of processes used to create files. "
-                                 f"Default value = {int(config['def_val']['multiprocessing'])}")
+                            help='If used, all output files (jsonl, csv and npz, also compressed) in the directory '
+                                 'specified by path_to_save_files (and its shard directories), starting with '
+                                 'file_name will be deleted before creating new ones.')
+        parser.add_argument("--clear_in_background", action='store_true',
+                            help='If used with --clear_path, only the files with the names of the new files are '
+                                 'deleted before creating them, the rest is deleted while the new files are created.')
+        parser.add_argument("--clear_threads", default=int(config['def_val']['clear_threads']), type=int,
+                            help=f"Number of threads deleting files for --clear_path. "
+                                 f"Default value = {int(config['def_val']['clear_threads'])}")
+        parser.add_argument("--shard_dirs", default=int(config['def_val']['shard_dirs']), type=int,
+                            help=f"If bigger than 0, the files are spread over this many subdirectories of "
+                                 f"path_to_save_files, chosen by a hash of the file name. "
+                                 f"Default value = {int(config['def_val']['shard_dirs'])}")
+        parser.add_argument("--multiprocessing", default=processes_type(config['def_val']['multiprocessing']),
+                            type=processes_type,
+                            help=f"Number of processes used to create files, or 'auto' to choose it based on the "
+                                 f"measured speed of creating the data and the amount of data to create. "
+                                 f"Default value = {config['def_val']['multiprocessing']}")
+        parser.add_argument("--engine", default=config['def_val']['engine'], type=str, choices=['python', 'numpy'],
+                            help=f"Engine used to generate the data. 'python' creates the data line by line, "
+                                 f"'numpy' creates whole columns of --batch_size lines at once (requires numpy). "
+                                 f"Default value = \"{config['def_val']['engine']}\"")
+        parser.add_argument("--batch_size", default=int(config['def_val']['batch_size']), type=int,
+                            help=f"Number of lines created at once by the 'numpy' engine and written at once by the "
+                                 f"'python' engine. Default value = {int(config['def_val']['batch_size'])}")
+        parser.add_argument("--chunk_lines", default=int(config['def_val']['chunk_lines']), type=int,
+                            help=f"Files with more lines than this are split into chunks of this many lines, created "
+                                 f"by different processes and merged afterwards (only when more than one process is "
+                                 f"used). Default value = {int(config['def_val']['chunk_lines'])}")
+        parser.add_argument("--format", default=config['def_val']['format'], type=str,
+                            choices=['jsonl', 'csv', 'npz'],
+                            help=f"Format of the created data. 'csv' has a header with the keys, 'npz' keeps one "
+                                 f"typed numpy array per key (requires numpy). "
+                                 f"Default value = \"{config['def_val']['format']}\"")
+        parser.add_argument("--compression", default=config['def_val']['compression'], type=str,
+                            choices=['none', 'gzip', 'bz2', 'xz'],
+                            help=f"Compression of the created files, which get .gz, .bz2 or .xz extension added. "
+                                 f"Any compression other than 'none' makes npz files deflate compressed. "
+                                 f"Default value = \"{config['def_val']['compression']}\"")
+        parser.add_argument("--compression_level", default=int(config['def_val']['compression_level']), type=int,
+                            help=f"Compression level from 1 (fastest) to 9 (smallest files). "
+                                 f"Default value = {int(config['def_val']['compression_level'])}")
+        parser.add_argument("--seed", default=None, type=int,
+                            help="Seed of the random values and file names - the same seed and options give the same "
+                                 "output, no matter how many processes are used (timestamps still come from the "
+                                 "clock). If not given, the output is different every time.")
+        parser.add_argument("--unordered", action='store_true',
+                            help='If used together with --files_count=0 and more than one process, blocks of lines are '
+                                 'printed as soon as any process creates them instead of in the order of creating.')
+        parser.add_argument("--serializer", default=config['def_val']['serializer'], type=str,
+                            choices=['json', 'template'],
+                            help=f"Way of turning the lines into json used by the 'python' engine. 'json' calls "
+                                 f"json.dumps for every line, 'template' encodes the keys and constant values once "
+                                 f"and formats only the remaining values. "
+                                 f"Default value = \"{config['def_val']['serializer']}\"")
+        parser.add_argument("--progress_interval", default=float(config['def_val']['progress_interval']), type=float,
+                            help=f"How often (in seconds) the number of created lines, megabytes and files and the "
+                                 f"speed are logged while the data is created. 0 turns it off. "
+                                 f"Default value = {config['def_val']['progress_interval']}")
+        parser.add_argument("--write_queue", default=int(config['def_val']['write_queue']), type=int,
+                            help=f"Number of blocks of lines that can wait for a separate thread writing them to the "
+                                 f"file, while the next ones are created. 0 writes them from the same thread. "
+                                 f"Default value = {config['def_val']['write_queue']}")
+        parser.add_argument("--write_buffer", default=int(config['def_val']['write_buffer']), type=int,
+                            help=f"Size of the buffer of every opened file in bytes. "
+                                 f"Default value = {config['def_val']['write_buffer']}")
+        parser.add_argument("--fsync", action='store_true',
+                            help="Every file is synced to the disk before it's closed.")
+        parser.add_argument("--stats", action='store_true',
+                            help=f"Statistics of every column (min, max, mean, nulls, the most common values) are "
+                                 f"counted while the data is created and saved next to every file as "
+                                 f"\"<file name>{stats.STATS_SUFFIX}\", and for the whole run as "
+                                 f"\"{stats.RUN_STATS}\".")
+        parser.add_argument("--faker_locale", default=config['def_val']['faker_locale'], type=str,
+                            help=f"Locale of the values of 'faker:<provider>' keys. "
+                                 f"Default value = \"{config['def_val']['faker_locale']}\"")
+        parser.add_argument("--faker_pool_size", default=int(config['def_val']['faker_pool_size']), type=int,
+                            help=f"Number of values created by every Faker provider once per process - every line "
+                                 f"takes a random one of them. The output has at most this many different values of "
+                                 f"a key, a bigger pool gives more of them but takes longer to create (about 0.1-0.2ms "
+                                 f"per value) and more memory. Default value = {config['def_val']['faker_pool_size']}")
+        parser.add_argument("--faker_cache", default=None, type=str,
+                            help="Directory to save the pools of Faker values to and load them from in the next runs "
+                                 "with the same provider, locale, pool size and seed.")
+        parser.add_argument("--resume", action='store_true',
+                            help="Creates only the files which the previous run in the same directory didn't finish, "
+                                 "according to its manifest (.datagen_manifest.jsonl). The data schema, number of "
+                                 "lines and the options changing the data have to be the same as before.")
+        parser.add_argument("--target_bytes", default=size_type(config['def_val']['target_bytes']), type=size_type,
+                            help=f"Total size of the data to create (e.g. 2T), instead of --data_lines lines in each "
+                                 f"of --files_count files. Files are filled one after another by every process, "
+                                 f"until they reach --file_bytes or --rows_per_file, and get their names only when "
+                                 f"they're started. Sizes are counted before compression. 0 turns it off. "
+                                 f"Default value = {config['def_val']['target_bytes']}")
+        parser.add_argument("--file_bytes", default=size_type(config['def_val']['file_bytes']), type=size_type,
+                            help=f"Size after which a new file is started when --target_bytes is used, e.g. 256M. "
+                                 f"0 is no limit. Default value = {config['def_val']['file_bytes']}")
+        parser.add_argument("--rows_per_file", default=int(config['def_val']['rows_per_file']), type=int,
+                            help=f"Number of lines after which a new file is started when --target_bytes is used. "
+                                 f"0 is no limit. Default value = {config['def_val']['rows_per_file']}")
+        parser.add_argument("--profile", default=None, type=str, choices=['cpu', 'mem'],
+                            help="Profiles every process creating the files with cProfile ('cpu') or tracemalloc "
+                                 "('mem') and saves one merged report of all of them to the directory of the files "
+                                 "- datagen_profile_cpu.txt/.prof or datagen_profile_mem.txt.")
+        parser.add_argument("--metrics_out", default=None, type=str,
+                            help="Path of a json file to save the final metrics to - rows, bytes, files, time of "
+                                 "generating, serializing and writing the data for every process and speed of the "
+                                 "whole run.")
 
     except ValueError:
         raise exc.InvalidDefaultConfiguration()
@@ -63,6 +193,70 @@ def parsing():
     return parser.parse_args()
 
 
+def verify_parsing(argv):
+    # arguments of "datagen verify <paths>", which checks already created files instead of creating new ones
+    parser = argparse.ArgumentParser(prog='datagen verify', description='Checks if every line of the given .jsonl '
+                                                                        'files (or the ones in the given directories) '
+                                                                        'matches the data schema.',
+                                     exit_on_error=False)
+    try:
+        config = configparser.ConfigParser()
+        config.read("default.ini")
+        parser.add_argument("paths", type=str, nargs="+",
+                            help="Files or directories with the files to verify - .jsonl files, compressed or not.")
+        parser.add_argument("--data_schema", default=config['def_val']['data_schema'], type=str,
+                            help=f"Json schema the files were created with, as json or a path to a json file. "
+                                 f"Default value = \"{config['def_val']['data_schema']}\"")
+        parser.add_argument("--multiprocessing", default=int(config['def_val']['multiprocessing']), type=int,
+                            help=f"Number of processes checking the files. "
+                                 f"Default value = {config['def_val']['multiprocessing']}")
+        parser.add_argument("--block_bytes", default=size_type(config['def_val']['verify_block_bytes']),
+                            type=size_type,
+                            help=f"Uncompressed files are split into parts of this many bytes (e.g. 64M), checked "
+                                 f"in parallel. Default value = {config['def_val']['verify_block_bytes']}")
+        parser.add_argument("--sample", default=int(config['def_val']['verify_sample']), type=int,
+                            help=f"Number of violating lines written out. "
+                                 f"Default value = {config['def_val']['verify_sample']}")
+        parser.add_argument("--report", default=None, type=str,
+                            help="Path of a json file to save the number of checked and violating lines and the "
+                                 "sample of violations to.")
+
+    except ValueError:
+        raise exc.InvalidDefaultConfiguration()
+
+    return parser.parse_args(argv)
+
+
+def verify_main(argv):
+    args = verify_parsing(argv)
+    if args.__dict__["block_bytes"] < 1 or args.__dict__["sample"] < 0:
+        raise exc.ValueNegative("Size of the parts of the files and the size of the sample")
+    compiled_schema = compile_data_schema(data_schema_arg(args))
+    file_paths = verify.find_files(args.__dict__["paths"])
+    if not file_paths:
+        raise exc.NoFilesToVerify(args.__dict__["paths"])
+    num_of_processes = multiprocessing_arg(args)
+
+    logging.info(f"Verifying {len(file_paths)} files...")
+    start = time.perf_counter()
+    result = verify.verify_files(file_paths, compiled_schema, num_of_processes, args.__dict__["block_bytes"],
+                                 args.__dict__["sample"])
+    seconds = time.perf_counter() - start
+    logging.info(f"Verified {result['lines']} lines of {result['files']} files in {seconds:.1f}s - "
+                 f"{result['lines'] / max(seconds, 1e-9):.0f} lines/s")
+    for violation in result["sample"]:
+        logging.warning(f"{violation['file']}, byte {violation['offset']}: {violation['problem']}"
+                        f"{' of ' + repr(violation['key']) if violation['key'] is not None else ''} - "
+                        f"{violation['line']}")
+    if args.__dict__["report"] is not None:
+        with open(args.__dict__["report"], "w") as report_file:
+            json.dump(result, report_file, indent=2)
+    if result["violations"]:
+        raise exc.VerificationFailed(result["violations"], result["lines"])
+    logging.info("All lines match the data schema")
+    return result
+
+
 def path_save_files_arg(args: argparse.Namespace):
     path = args.__dict__['path_to_save_files']
     logging.info(f"Checking path to the directory where the files will be placed...")
@@ -88,16 +282,24 @@ def files_count_arg(args: argparse.Namespace):
 
 def data_schema_arg(args: argparse.Namespace):
     logging.info("Checking the data schema...")
-    data_schema = args.__dict__["data_schema"]
+    data_schema = load_data_schema(args.__dict__["data_schema"])
+    logging.info("Given data schema is correct")
+    return data_schema
+
+
+def load_data_schema(data_schema):
+    # the schema can be given as a path to a json file, json text or an already loaded dict
+    if isinstance(data_schema, dict):
+        return data_schema
 
     if data_schema[-5:] == ".json":
         if not os.path.exists(data_schema) or not os.path.isfile(data_schema):
             raise exc.NonexistentSchemaFile(data_schema)
-        file = open(data_schema, "r")
-        try:
-            data_schema = json.load(file)
-        except SyntaxError as e:
-            raise exc.IncorrectSchema(e.msg.capitalize())
+        with open(data_schema, "r") as file:
+            try:
+                data_schema = json.load(file)
+            except json.decoder.JSONDecodeError as e:
+                raise exc.IncorrectSchema(e.msg.capitalize())
 
     else:
         try:
@@ -106,22 +308,83 @@ def data_schema_arg(args: argparse.Namespace):
         except json.decoder.JSONDecodeError as e:
             raise exc.IncorrectSchema(e.msg.capitalize())
 
-    logging.info("Given data schema is correct")
+    if not isinstance(data_schema, dict):
+        raise exc.IncorrectSchema("It has to be a json object")
     return data_schema
 
 
-def clear_path_arg(args: argparse.Namespace, path):
+def clear_path_arg(args: argparse.Namespace, path, files_to_create):
     clear_path = args.__dict__["clear_path"]
     if clear_path:
         file_name = args.__dict__["file_name"]
-        logging.info(f"Deleting all jsonl files containing '{file_name}' in their name from {path}")
-        for file in os.listdir(path):
-            if re.search(file_name, file) and re.search(".jsonl", file):
-                os.remove(os.path.join(path, file))
+        threads = int(args.__dict__["clear_threads"])
+        if threads < 1:
+            raise exc.ValueNegative("Number of threads deleting files")
+
+        logging.info(f"Deleting all output files starting with '{file_name}' from {path}")
+        if args.__dict__["clear_in_background"]:
+            return clear.clear_path_in_background(path, file_name, OUTPUT_EXTENSIONS, threads, files_to_create)
+        clear.clear_path(path, file_name, OUTPUT_EXTENSIONS, threads)
+    return None
+
+
+def shard_dirs_arg(args: argparse.Namespace):
+    shard_dirs = int(args.__dict__["shard_dirs"])
+    if shard_dirs < 0:
+        raise exc.ValueNegative("Number of shard directories")
+    return shard_dirs
+
+
+def processes_type(value):
+    # a number of processes or 'auto'
+    if value == "auto":
+        return value
+    return int(value)
+
+
+# multipliers of the suffixes of sizes, like 256M or 2T
+SIZE_UNITS = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+
+
+def size_type(value):
+    # a number of bytes, with an optional K, M, G or T suffix
+    number, unit = value[:-1], value[-1].upper()
+    if unit.isdigit():
+        number, unit = value, ""
+    if unit not in SIZE_UNITS:
+        raise ValueError(value)
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def rolling_limits_arg(args: argparse.Namespace, num_of_saving_files, options):
+    # None if the run creates files of a given number of lines, instead of filling up a given size
+    target_bytes = args.__dict__["target_bytes"]
+    if target_bytes == 0:
+        return None
+
+    limits = RollingLimits(target_bytes, args.__dict__["file_bytes"], args.__dict__["rows_per_file"])
+    if min(limits) < 0:
+        raise exc.ValueNegative("Size of the output, size and number of lines of a file")
+    if not limits.file_bytes and not limits.rows_per_file:
+        raise exc.IncompatibleOptions("--target_bytes", "--file_bytes 0 and --rows_per_file 0")
+    for option, incompatible in [("--files_count 0", num_of_saving_files == 0),
+                                 ("--format npz", options.file_format == "npz"),
+                                 ("--resume", args.__dict__["resume"]),
+                                 ("--clear_in_background", args.__dict__["clear_in_background"])]:
+        if incompatible:
+            raise exc.IncompatibleOptions("--target_bytes", option)
+    logging.info(f"Creating {target_bytes} bytes of data in files of at most "
+                 f"{limits.file_bytes or 'any number of'} bytes and {limits.rows_per_file or 'any number of'} lines")
+    return limits
 
 
 def multiprocessing_arg(args: argparse.Namespace):
-    num_of_processes = int(args.__dict__["multiprocessing"])
+    # 'auto' is resolved later by auto_processes, once the schema and the amount of data are known
+    num_of_processes = args.__dict__["multiprocessing"]
+    if num_of_processes == "auto":
+        return num_of_processes
+    if num_of_processes < 1:
+        raise exc.ValueNegative("Number of processes")
     if num_of_processes > os.cpu_count():
         num_of_processes = os.cpu_count()
     if num_of_processes > 1:
@@ -129,50 +392,164 @@ def multiprocessing_arg(args: argparse.Namespace):
     return num_of_processes
 
 
-def create_file_names(num_of_saving_files, file_name, suffix):
+def engine_arg(args: argparse.Namespace):
+    engine = args.__dict__["engine"]
+    if engine == "numpy" and np is None:
+        raise exc.MissingDependency("numpy", "--engine numpy")
+    if engine != "python":
+        logging.info(f"Using '{engine}' engine to create the data")
+    return engine
+
+
+def batch_size_arg(args: argparse.Namespace):
+    batch_size = int(args.__dict__["batch_size"])
+    if batch_size < 1:
+        raise exc.ValueNegative("Batch size")
+    return batch_size
+
+
+def chunk_lines_arg(args: argparse.Namespace):
+    chunk_lines = int(args.__dict__["chunk_lines"])
+    if chunk_lines < 1:
+        raise exc.ValueNegative("Number of lines in a chunk")
+    return chunk_lines
+
+
+def format_arg(args: argparse.Namespace, num_of_saving_files):
+    file_format = args.__dict__["format"]
+    if file_format == "npz":
+        if np is None:
+            raise exc.MissingDependency("numpy", "--format npz")
+        if num_of_saving_files == 0:
+            raise exc.IncompatibleOptions("--format npz", "--files_count 0")
+    return file_format
+
+
+def write_queue_arg(args: argparse.Namespace):
+    write_queue = int(args.__dict__["write_queue"])
+    if write_queue < 0:
+        raise exc.ValueNegative("Write queue size")
+    return write_queue
+
+
+def write_buffer_arg(args: argparse.Namespace):
+    write_buffer = int(args.__dict__["write_buffer"])
+    if write_buffer < 0:
+        raise exc.ValueNegative("Write buffer size")
+    return write_buffer
+
+
+def faker_options_arg(args: argparse.Namespace):
+    pool_size = int(args.__dict__["faker_pool_size"])
+    if pool_size < 1:
+        raise exc.ValueNegative("Size of the pool of Faker values")
+    return faker_pools.FakerOptions(locale=args.__dict__["faker_locale"], pool_size=pool_size,
+                                    seed=args.__dict__["seed"], cache_dir=args.__dict__["faker_cache"])
+
+
+def unique_values_arg(compiled_schema, num_of_saving_files, data_lines):
+    # checked before any file is created, instead of failing once the range runs out
+    for column in compiled_schema:
+        if column.kind in UNIQUE_KINDS and num_of_saving_files * data_lines > column.value.size:
+            raise exc.UniqueValuesExhausted(column.value.low, column.value.size)
+
+
+def resume_arg(args: argparse.Namespace):
+    resume = args.__dict__["resume"]
+    if resume and args.__dict__["clear_path"]:
+        raise exc.IncompatibleOptions("--resume", "--clear_path")
+    return resume
+
+
+def profile_arg(args: argparse.Namespace, num_of_saving_files):
+    profile_mode = args.__dict__["profile"]
+    if profile_mode is not None and num_of_saving_files == 0:
+        raise exc.IncompatibleOptions("--profile", "--files_count 0")
+    return profile_mode
+
+
+def stats_arg(args: argparse.Namespace, num_of_saving_files):
+    if args.__dict__["stats"] and num_of_saving_files == 0:
+        raise exc.IncompatibleOptions("--stats", "--files_count 0")
+    return args.__dict__["stats"]
+
+
+def compression_level_arg(args: argparse.Namespace):
+    compression_level = int(args.__dict__["compression_level"])
+    if not 1 <= compression_level <= 9:
+        raise exc.ValueOutOfRange("Compression level", 1, 9)
+    return compression_level
+
+
+def seed_arg(args: argparse.Namespace):
+    seed = args.__dict__["seed"]
+    if seed is not None and seed < 0:
+        raise exc.ValueNegative("Seed")
+    return seed
+
+
+def create_file_names(num_of_saving_files, file_name, suffix, extension=".jsonl", seed=None, shard_dirs=0):
     logging.info("Creating a list of names for the files that will be created")
+    rng = random.Random(seed)
 
     files_to_create = []
-    list_of_taken_numbers = []
     max_num = max(num_of_saving_files, 9999)
 
     if num_of_saving_files > 1:
+        if suffix == "random":
+            # different numbers for every file at once, instead of drawing again until a free one is found
+            random_numbers = rng.sample(range(1, max_num + 1), num_of_saving_files)
+
         for i in range(1, num_of_saving_files + 1):
 
             if suffix == "count":
                 this_file_name = file_name + str(i)
 
             elif suffix == "random":
-                rand_num = random.randint(1, max_num)
-                while rand_num in list_of_taken_numbers:
-                    rand_num = random.randint(1, max_num)
-                list_of_taken_numbers.append(rand_num)
-
-                this_file_name = file_name + str(rand_num)
+                this_file_name = file_name + str(random_numbers[i - 1])
 
             else:
-                suf_uuid = str(uuid.uuid4())
+                suf_uuid = _rand_uuid(rng.getrandbits)
                 this_file_name = file_name + suf_uuid
 
-            this_file_name += ".jsonl"
+            this_file_name += extension
             files_to_create.append(this_file_name)
 
     elif num_of_saving_files == 1:
-        files_to_create.append(file_name + ".jsonl")
+        files_to_create.append(file_name + extension)
+
+    if shard_dirs > 0:
+        files_to_create = [os.path.join(shard_dir_name(this_file_name, shard_dirs), this_file_name)
+                           for this_file_name in files_to_create]
 
     return files_to_create
 
 
+def shard_dir_names(shard_dirs):
+    width = len(str(shard_dirs - 1))
+    return [str(shard_index).zfill(width) for shard_index in range(shard_dirs)]
+
+
+def shard_dir_name(this_file_name, shard_dirs):
+    # crc32 instead of hash(), because it's the same in every run - so the same name always lands in the same directory
+    return str(zlib.crc32(this_file_name.encode()) % shard_dirs).zfill(len(str(shard_dirs - 1)))
+
+
+def create_shard_dirs(path, shard_dirs):
+    for shard_dir in shard_dir_names(shard_dirs):
+        os.makedirs(os.path.join(path, shard_dir), exist_ok=True)
+
+
 def check_warnings(data_schema, warnings):
     for key in data_schema.keys():
         if ":" in data_schema[key]:
-            left, right = data_schema[key].split(":")
+            left, right = data_schema[key].split(":", 1)
 
-            if right != "" and left == "timestamp":
+            if right != "" and left == "timestamp" and right[:6] != "range(":
                 warnings["timestamp_with_value_warning"][0] = True
                 warnings["timestamp_with_value_warning"].append(key)
 
-            elif left not in ["str", "int", "timestamp", "float"]:
+            elif left not in ["str", "int", "timestamp", "float", "faker"]:
                 warnings["data_without_type_warning"][0] = True
                 warnings["data_without_type_warning"].append(key)
 
@@ -183,103 +560,1599 @@ def check_warnings(data_schema, warnings):
     return warnings
 
 
-def create_data_line(data_schema):
-    current_line = {}
-    # checking every key: value from the data_schema
-    for key in data_schema.keys():
-        # checking if the type of the value is correctly given, for example "int:rand"
-        if ":" in data_schema[key]:
-            # splitting the value from "int:rand" to left = int, right = rand
-            left, right = data_schema[key].split(":")
-
-            # type given without a value case
-            if right == "":
-                # timestamp without a value case
-                if left == "timestamp":
-                    current_line[key] = time.time()
-                elif left == "str":
-                    current_line[key] = ""
-                elif left == "int" or left == "float":
-                    current_line[key] = None
-
-            # timestamp with a value case - value is ignored
-            # the warning will be written later in the check_warnings function
-            elif left == "timestamp":
-                current_line[key] = time.time()
-
-            # value = rand(x, y) case, only working when left == int
-            elif right[:5] == "rand(":
-                if left != "int":
-                    raise exc.WrongTypeRandRange
-                values = right[5: -1]
-                left_val, right_val = values.split(",")
+# compiled form of a single key from the data schema - "generator" is a picklable callable, which takes a random
+# number generator (random.Random) and returns a function creating the next values from it, "kind" and "value" keep
+# the parsed schema entry for the code that needs more than a single value at a time
+Column = namedtuple("Column", ["key", "type", "kind", "value", "generator"])
+
+
+def _constant(value):
+    return value
+
+
+def _rand_uuid(getrandbits):
+    return str(uuid.UUID(int=getrandbits(128), version=4))
+
+
+# translation tables setting the version (4) and variant (RFC 4122) bits of the 7th and 9th byte of an uuid4
+_UUID_VERSION = bytes((byte & 0x0f) | 0x40 for byte in range(256))
+_UUID_VARIANT = bytes((byte & 0x3f) | 0x80 for byte in range(256))
+
+# number of uuids created at once by a single str:rand column
+UUID_BLOCK = 4096
+
+
+def bulk_uuids(getrandbits, count):
+    # count valid uuid4 values with a single call for random bits, bits of every uuid set at once and a single hex
+    # conversion - not the same ones count calls of _rand_uuid would give, because one big getrandbits orders the
+    # random words differently, so str:rand values of a --seed depend on this function
+    data = bytearray(getrandbits(128 * count).to_bytes(16 * count, "big"))
+    data[6::16] = data[6::16].translate(_UUID_VERSION)
+    data[8::16] = data[8::16].translate(_UUID_VARIANT)
+    hex_data = data.hex()
+    return ["%s-%s-%s-%s-%s" % (hex_data[i:i + 8], hex_data[i + 8:i + 12], hex_data[i + 12:i + 16],
+                                hex_data[i + 16:i + 20], hex_data[i + 20:i + 32]) for i in range(0, 32 * count, 32)]
+
+
+if np is not None:
+    _HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    # places of the hex digits in "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+    _UUID_HEX_POSITIONS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+
+def numpy_bulk_uuids(rng, count, quoted=False):
+    # the whole batch is built as a single (count, 36) array of ascii characters
+    data = np.frombuffer(rng.bytes(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    data[:, 6] = (data[:, 6] & 0x0f) | 0x40
+    data[:, 8] = (data[:, 8] & 0x3f) | 0x80
+
+    width = 38 if quoted else 36
+    offset = 1 if quoted else 0
+    characters = np.full((count, width), ord("-"), dtype=np.uint8)
+    characters[:, _UUID_HEX_POSITIONS + offset] = np.stack([_HEX_DIGITS[data >> 4], _HEX_DIGITS[data & 0x0f]],
+                                                           axis=2).reshape(count, 32)
+    if quoted:
+        characters[:, 0] = characters[:, -1] = ord('"')
+
+    text = characters.tobytes().decode("ascii")
+    return [text[i:i + width] for i in range(0, width * count, width)]
+
+
+def _constant_generator(value, rng):
+    return partial(_constant, value)
+
+
+def _timestamp_generator(rng):
+    return time.time
+
+
+def _rand_int_generator(left_val, right_val, rng):
+    return partial(rng.randint, left_val, right_val)
+
+
+def _rand_choice_generator(choices, rng):
+    return partial(rng.choice, choices)
+
+
+# choices with the alias table of their weights, built once for the whole schema
+WeightedChoices = namedtuple("WeightedChoices", ["choices", "probability", "alias"])
+
+
+def alias_table(weights):
+    # Vose's alias method - index i is kept with probability[i] and replaced by alias[i] otherwise, so sampling from
+    # any number of weighted choices takes a single random number
+    count = len(weights)
+    scaled = [weight * count / sum(weights) for weight in weights]
+    probability, alias = [1.0] * count, list(range(count))
+    small = [index for index, weight in enumerate(scaled) if weight < 1]
+    large = [index for index, weight in enumerate(scaled) if weight >= 1]
+
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probability[less], alias[less] = scaled[less], more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+
+    # whatever is left has (up to rounding errors) a probability of 1
+    return probability, alias
+
+
+def _weighted_choice(choices, rng_random):
+    position = rng_random() * len(choices.choices)
+    index = int(position)
+    if position - index >= choices.probability[index]:
+        index = choices.alias[index]
+    return choices.choices[index]
+
+
+def _weighted_choice_generator(choices, rng):
+    return partial(_weighted_choice, choices, rng.random)
+
+
+def _faker_generator(faker_column, rng):
+    return partial(rng.choice, faker_pools.value_pool(faker_column))
+
+
+def _sequence_generator(start, step, rng, first_row, file_offset=0):
+    return partial(next, count(start + first_row * step, step))
+
+
+# values of a unique column are a keyed permutation of its range, taken at the position of the row in the whole run -
+# files and chunks have disjoint positions, so no process has to remember the values created by the others
+UniqueRange = namedtuple("UniqueRange", ["low", "size", "half_bits", "keys"])
+
+UNIQUE_ROUNDS = 4
+MASK_64 = 2 ** 64 - 1
+# odd constants of splitmix64, used by the round function
+ROUND_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9)
+
+
+def unique_range(low, high, key, seed=None):
+    # keys of the rounds are the same in every process - from the seed, or random ones shipped with the schema
+    rng = random.Random(None if seed is None else f"{seed}:unique:{key}")
+    size = high - low + 1
+    # the permutation is on the smallest even number of bits covering the range, values out of it are walked past
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    return UniqueRange(low, size, half_bits, tuple(rng.getrandbits(64) for _ in range(UNIQUE_ROUNDS)))
+
+
+def _round(half, key, half_bits):
+    mixed = ((half ^ key) * ROUND_MULTIPLIERS[0]) & MASK_64
+    mixed = ((mixed ^ (mixed >> 31)) * ROUND_MULTIPLIERS[1]) & MASK_64
+    return mixed >> (64 - half_bits)
+
+
+def _feistel(unique_range, value):
+    half_bits = unique_range.half_bits
+    left, right = value >> half_bits, value & ((1 << half_bits) - 1)
+    for key in unique_range.keys:
+        left, right = right, left ^ _round(right, key, half_bits)
+    return (left << half_bits) | right
+
+
+def permute(unique_range, position):
+    # a bijection of range(size) - cycle walking keeps the values inside of it, taking less than 4 steps on average
+    if position >= unique_range.size:
+        raise exc.UniqueValuesExhausted(unique_range.low, unique_range.size)
+    value = _feistel(unique_range, position)
+    while value >= unique_range.size:
+        value = _feistel(unique_range, value)
+    return value
+
+
+def _unique_values(unique_range, position, to_value):
+    for position in count(position):
+        yield to_value(unique_range.low + permute(unique_range, position))
+
+
+def _unique_int_generator(unique_range, rng, first_row, file_offset=0):
+    return partial(next, _unique_values(unique_range, file_offset + first_row, int))
+
+
+def _unique_str_generator(unique_range, rng, first_row, file_offset=0):
+    return partial(next, _unique_values(unique_range, file_offset + first_row, "{:016x}".format))
+
+
+def _time_range_values(start, step, jitter, rng_random, first_row):
+    for row in count(first_row):
+        yield start + step * row + rng_random() * jitter
+
+
+def _time_range_generator(start, step, jitter, rng, first_row, file_offset=0):
+    if not jitter:
+        return partial(next, (start + step * row for row in count(first_row)))
+    return partial(next, _time_range_values(start, step, jitter, rng.random, first_row))
+
+
+def _uuid_blocks(getrandbits):
+    # blocks start small, so that files with just a few lines don't create thousands of unused uuids
+    count = 16
+    while True:
+        yield bulk_uuids(getrandbits, count)
+        count = min(2 * count, UUID_BLOCK)
+
+
+def _rand_uuid_generator(rng):
+    # uuids are created in blocks and handed out one by one
+    return partial(next, chain.from_iterable(_uuid_blocks(rng.getrandbits)))
+
+
+def _parse_arguments(text, defaults, value_type):
+    # "1, 2" -> (1, 2, *the rest of the defaults), only the first argument is required - None if anything is wrong
+    try:
+        values = [value_type(value.strip()) for value in text.split(",")]
+    except ValueError:
+        return None
+    if not 1 <= len(values) <= len(defaults) + 1:
+        return None
+    return tuple(values) + tuple(value_type(default) for default in defaults[len(values) - 1:])
+
+
+def _literal_dict(text):
+    if text[0] != "{" or text[-1] != "}":
+        return False
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return False
+    return isinstance(value, dict) and len(value) > 0
+
+
+def compile_column(key, schema_value, faker_options=faker_pools.FakerOptions(), seed=None):
+    if not isinstance(schema_value, str):
+        raise exc.IncorrectSchema(f"Value for '{key}' has to be a string")
+
+    # checking if the type of the value is correctly given, for example "int:rand"
+    if ":" in schema_value:
+        # splitting the value from "int:rand" to left = int, right = rand - only at the first ':', because weighted
+        # choices like "str:{'a': 0.5}" have more of them
+        left, right = schema_value.split(":", 1)
+
+        # values of a Faker provider, e.g. "faker:name" - taken from a pool created once per process
+        if left == "faker":
+            faker_column = faker_pools.faker_column(key, right, faker_options)
+            return Column(key, left, "faker", faker_column, partial(_faker_generator, faker_column))
+
+        # type given without a value case
+        if right == "":
+            # timestamp without a value case
+            if left == "timestamp":
+                return Column(key, left, "timestamp", None, _timestamp_generator)
+            elif left == "str":
+                return Column(key, left, "const", "", partial(_constant_generator, ""))
+            elif left == "int" or left == "float":
+                return Column(key, left, "const", None, partial(_constant_generator, None))
+
+        # value = range(start, step, jitter) case - timestamps going up by step seconds from the start, every one of
+        # them moved forward by a random part of jitter
+        elif left == "timestamp" and right[:6] == "range(" and right[-1] == ")":
+            time_range = _parse_arguments(right[6:-1], (1, 0), float)
+            if time_range is None or not 0 <= time_range[2] <= abs(time_range[1]):
+                raise exc.IncorrectValue(right, "timestamp:range(start, step, jitter), 0 <= jitter <= |step|")
+            return Column(key, left, "time_range", time_range, partial(_time_range_generator, *time_range))
+
+        # timestamp with a value case - value is ignored
+        # the warning will be written later in the check_warnings function
+        elif left == "timestamp":
+            return Column(key, left, "timestamp", None, _timestamp_generator)
+
+        # value = rand(x, y) case, only working when left == int
+        elif right[:5] == "rand(":
+            if left != "int":
+                raise exc.WrongTypeRandRange
+            try:
+                left_val, right_val = right[5: -1].split(",")
                 left_val = int(left_val.strip())
                 right_val = int(right_val.strip())
-                current_line[key] = random.randint(min(left_val, right_val), max(left_val, right_val))
-
-            # other cases of 'rand' values
-            elif right == "rand":
-                if left == "str":
-                    current_line[key] = str(uuid.uuid4())
-                elif left == "int":
-                    current_line[key] = random.randint(0, 10000)
-
-            # list with choices case
-            elif right[0] == "[" and right[-1] == "]":
-                try:
-                    choices = ast.literal_eval(right)
-                    current_line[key] = random.choice(choices)
-                except SyntaxError:
-                    raise exc.WrongListOfChoices(key)
-
-            # plain values - float values possible too
-            elif left != "str":
-                try:
-                    right_val = ast.literal_eval(right)
-                    if type(right_val).__name__ == left:
-                        current_line[key] = right_val
-                    else:
-                        raise ValueError
-                except (ValueError, SyntaxError):
-                    if left != 'int' and left != 'float':
-                        raise exc.IncorrectType(left)
-                    else:
-                        raise exc.IncorrectValue(right, left)
+            except ValueError:
+                raise exc.IncorrectValue(right, left)
+            bounds = (min(left_val, right_val), max(left_val, right_val))
+            return Column(key, left, "randint", bounds, partial(_rand_int_generator, *bounds))
+
+        # value = unique(low, high) case - every value of the range at most once in the whole run
+        elif right[:7] == "unique(" and right[-1] == ")":
+            if left != "int":
+                raise exc.IncorrectType(left + " with unique(low, high)")
+            bounds = _parse_arguments(right[7:-1], (0,), int) if right.count(",") == 1 else None
+            if bounds is None or bounds[0] > bounds[1] or bounds[1] - bounds[0] >= 2 ** 64:
+                raise exc.IncorrectValue(right, "int:unique(low, high), low <= high, at most 2^64 values")
+            unique_ints = unique_range(*bounds, key, seed)
+            return Column(key, left, "unique_int", unique_ints, partial(_unique_int_generator, unique_ints))
+
+        # value = seq(start, step) case - numbers of the rows, counted from start by step
+        elif right[:4] == "seq(" and right[-1] == ")":
+            if left != "int":
+                raise exc.IncorrectType(left + " with seq(start, step)")
+            sequence = _parse_arguments(right[4:-1], (1,), int)
+            if sequence is None:
+                raise exc.IncorrectValue(right, "int:seq(start, step)")
+            return Column(key, left, "sequence", sequence, partial(_sequence_generator, *sequence))
+
+        # unique strings - 16 hex digits of a permutation of 64 bit numbers
+        elif right == "unique":
+            if left != "str":
+                raise exc.IncorrectType(left + " with unique")
+            unique_strs = unique_range(0, MASK_64, key, seed)
+            return Column(key, left, "unique_str", unique_strs, partial(_unique_str_generator, unique_strs))
+
+        # other cases of 'rand' values
+        elif right == "rand":
+            if left == "str":
+                return Column(key, left, "uuid", None, _rand_uuid_generator)
+            elif left == "int":
+                return Column(key, left, "randint", (0, 10000), partial(_rand_int_generator, 0, 10000))
+
+        # list with choices case
+        elif right[0] == "[" and right[-1] == "]":
+            try:
+                choices = ast.literal_eval(right)
+            except (ValueError, SyntaxError):
+                raise exc.WrongListOfChoices(key)
+            if not choices:
+                raise exc.WrongListOfChoices(key)
+            return Column(key, left, "choice", choices, partial(_rand_choice_generator, choices))
+
+        # dict with choices and their weights case - other values in braces are still plain values
+        elif _literal_dict(right):
+            weighted = ast.literal_eval(right)
+            if not all(type(weight) in (int, float) and weight >= 0 for weight in weighted.values()) \
+                    or sum(weighted.values()) <= 0:
+                raise exc.WrongListOfChoices(key)
+            choices = WeightedChoices(list(weighted), *alias_table(list(weighted.values())))
+            return Column(key, left, "weighted", choices, partial(_weighted_choice_generator, choices))
+
+        # plain values - float values possible too
+        elif left != "str":
+            try:
+                right_val = ast.literal_eval(right)
+                if type(right_val).__name__ != left:
+                    raise ValueError
+            except (ValueError, SyntaxError):
+                if left != 'int' and left != 'float':
+                    raise exc.IncorrectType(left)
+                else:
+                    raise exc.IncorrectValue(right, left)
+            return Column(key, left, "const", right_val, partial(_constant_generator, right_val))
+
+        else:
+            return Column(key, left, "const", right, partial(_constant_generator, right))
+
+    elif schema_value == "timestamp":
+        return Column(key, "timestamp", "timestamp", None, _timestamp_generator)
+
+    # keys without a type are ignored - the warning will be written later in the check_warnings function
+    return None
+
+
+def compile_data_schema(data_schema, faker_options=faker_pools.FakerOptions(), seed=None):
+    # parsing the schema once, so that every row only has to call already prepared generators
+    compiled_schema = []
+    for key in data_schema.keys():
+        column = compile_column(key, data_schema[key], faker_options, seed)
+        if column is not None:
+            compiled_schema.append(column)
+
+    return compiled_schema
+
+
+# kinds of columns whose values depend on the number of the row, their generators take the number of the first row too
+# - file_offset is the number of rows of the run before the first row of the file, for the values unique in the run
+ROW_KINDS = ("sequence", "time_range", "unique_int", "unique_str")
+UNIQUE_KINDS = ("unique_int", "unique_str")
+
+
+def has_unique_columns(compiled_schema):
+    return any(column.kind in UNIQUE_KINDS for column in compiled_schema)
+
+
+def bind_generators(compiled_schema, rng, first_row=0, file_offset=0):
+    # (key, function creating the next value) for every column, all taking their values from the given generator
+    return [(column.key, column.generator(rng, first_row, file_offset) if column.kind in ROW_KINDS
+             else column.generator(rng)) for column in compiled_schema]
+
+
+def create_data_line(generators):
+    return {key: generate() for key, generate in generators}
+
+
+# characters that json.dumps would escape in a string (the same set as json.encoder.ESCAPE_ASCII)
+_NEEDS_ESCAPE = re.compile(r'([\\"]|[^\ -~])')
+
+
+def _escape_braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _quote(value):
+    return '"' + value + '"'
+
+
+def _encode_value(value):
+    # fast paths for the most common values, everything else is left to json.dumps
+    value_type = type(value)
+    if value_type is str and _NEEDS_ESCAPE.search(value) is None:
+        return '"' + value + '"'
+    elif value_type is int:
+        return int.__repr__(value)
+    elif value is None:
+        return "null"
+    return json.dumps(value)
 
-            else:
-                current_line[key] = right
 
-        elif data_schema[key] == "timestamp":
-            current_line[key] = time.time()
+# encoders of the values that don't need to be checked before writing them out
+VALUE_ENCODERS = {"timestamp": float.__repr__, "randint": int.__repr__, "uuid": _quote, "sequence": int.__repr__,
+                  "time_range": float.__repr__, "unique_int": int.__repr__, "unique_str": _quote}
 
-    return current_line
 
+def jsonl_template(compiled_schema):
+    # '{"key_1": {}, "key_2": "constant"}\n' - keys and constant values are encoded once,
+    # only the other values have to be put in for every line
+    fields = []
+    for column in compiled_schema:
+        value = _escape_braces(json.dumps(column.value)) if column.kind == "const" else "{}"
+        fields.append(_escape_braces(json.dumps(column.key)) + ": " + value)
+    return "{{" + ", ".join(fields) + "}}\n"
 
-def create_file_with_data(this_file_name, path_to_save_files, data_schema, data_lines):
+
+def dynamic_columns(compiled_schema):
+    return [column for column in compiled_schema if column.kind != "const"]
+
+
+def json_lines_serializer(compiled_schema, rng, first_row=0, file_offset=0):
+    generators = bind_generators(compiled_schema, rng, first_row, file_offset)
+
+    def create_lines(lines_count):
+        return "".join([json.dumps(create_data_line(generators)) + "\n" for _ in range(lines_count)])
+
+    return create_lines
+
+
+def template_lines_serializer(compiled_schema, rng, first_row=0, file_offset=0):
+    template = jsonl_template(compiled_schema)
+    columns = dynamic_columns(compiled_schema)
+    generators = [(generate, VALUE_ENCODERS.get(column.kind, _encode_value))
+                  for column, (_, generate) in zip(columns, bind_generators(columns, rng, first_row, file_offset))]
+
+    if not generators:
+        line = template.format()
+        return lambda lines_count: line * lines_count
+
+    def create_lines(lines_count):
+        return "".join([template.format(*[encode(generate()) for generate, encode in generators])
+                        for _ in range(lines_count)])
+
+    return create_lines
+
+
+SERIALIZERS = {"json": json_lines_serializer, "template": template_lines_serializer}
+
+
+def _object_array(values):
+    # np.array would try to turn nested lists into more dimensions
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+# clock read by the last batch of timestamps of the current process - reset by every new stream, so its first batch
+# doesn't go back to the time the previous one ended
+_last_clock = [time.time()]
+
+
+def reset_clock():
+    _last_clock[0] = time.time()
+
+
+def batch_timestamps(batch_size):
+    # one clock read per batch instead of one per line - the values are spread evenly between the previous read and
+    # this one, so the rows of a batch go up with the time they were created in, instead of all having the same value
+    now = time.time()
+    values = np.linspace(_last_clock[0], now, batch_size + 1)[1:]
+    _last_clock[0] = now
+    return values
+
+
+def create_column_values(column, batch_size, rng, first_row=0, file_offset=0):
+    # returns values of a single column for the whole batch, as a numpy array where possible
+    if column.kind == "timestamp":
+        return batch_timestamps(batch_size)
+
+    elif column.kind == "sequence":
+        start, step = column.value
+        return np.arange(first_row, first_row + batch_size, dtype=object) * step + start
+
+    elif column.kind == "time_range":
+        start, step, jitter = column.value
+        values = start + step * np.arange(first_row, first_row + batch_size, dtype=np.float64)
+        return values + rng.random(batch_size) * jitter if jitter else values
+
+    elif column.kind in UNIQUE_KINDS:
+        positions = np.arange(file_offset + first_row, file_offset + first_row + batch_size, dtype=np.uint64)
+        values = numpy_permute(column.value, positions)
+        if column.kind == "unique_str":
+            return np.char.mod("%016x", values)
+        return values.astype(object) + column.value.low
+
+    elif column.kind == "randint":
+        left_val, right_val = column.value
+        if left_val < -2 ** 63 or right_val >= 2 ** 63:
+            # range doesn't fit into int64, so numpy can't be used for it
+            python_rng = random.Random(rng.bytes(16))
+            return [python_rng.randint(left_val, right_val) for _ in range(batch_size)]
+        return rng.integers(left_val, right_val, size=batch_size, endpoint=True)
+
+    elif column.kind == "choice":
+        return _object_array(column.value)[rng.integers(0, len(column.value), size=batch_size)]
+
+    elif column.kind == "weighted":
+        return _object_array(column.value.choices)[weighted_indexes(column.value, batch_size, rng)]
+
+    elif column.kind == "faker":
+        pool = faker_pools.value_pool(column.value)
+        return _object_array(pool)[rng.integers(0, len(pool), size=batch_size)]
+
+    elif column.kind == "uuid":
+        return numpy_bulk_uuids(rng, batch_size)
+
+    return [column.value] * batch_size
+
+
+def _numpy_feistel(unique_range, values):
+    half_bits = np.uint64(unique_range.half_bits)
+    shift, mask = np.uint64(64) - half_bits, np.uint64((1 << unique_range.half_bits) - 1)
+    left, right = values >> half_bits, values & mask
+    for key in unique_range.keys:
+        # uint64 arithmetic wraps around like the masked python one
+        mixed = (right ^ np.uint64(key)) * np.uint64(ROUND_MULTIPLIERS[0])
+        mixed = (mixed ^ (mixed >> np.uint64(31))) * np.uint64(ROUND_MULTIPLIERS[1])
+        left, right = right, left ^ (mixed >> shift)
+    return (left << half_bits) | right
+
+
+def numpy_permute(unique_range, positions):
+    # the same values as permute, for the whole batch at once
+    if len(positions) and int(positions[-1]) >= unique_range.size:
+        raise exc.UniqueValuesExhausted(unique_range.low, unique_range.size)
+    values = _numpy_feistel(unique_range, positions)
+    if unique_range.size <= MASK_64:
+        outside = values >= np.uint64(unique_range.size)
+        while outside.any():
+            values[outside] = _numpy_feistel(unique_range, values[outside])
+            outside[outside] = values[outside] >= np.uint64(unique_range.size)
+    return values
+
+
+def weighted_indexes(choices, batch_size, rng):
+    # the alias method for the whole batch at once
+    positions = rng.random(batch_size) * len(choices.choices)
+    indexes = positions.astype(np.intp)
+    return np.where(positions - indexes < np.asarray(choices.probability)[indexes], indexes,
+                    np.asarray(choices.alias, dtype=np.intp)[indexes])
+
+
+def create_column_batch(column, batch_size, rng, first_row=0, file_offset=0):
+    # returns already json encoded values of a single column for the whole batch
+    if column.kind == "timestamp":
+        return list(map(repr, batch_timestamps(batch_size).tolist()))
+
+    elif column.kind == "unique_str":
+        return list(map(_quote, create_column_values(column, batch_size, rng, first_row, file_offset).tolist()))
+
+    elif column.kind in ROW_KINDS:
+        return list(map(repr, create_column_values(column, batch_size, rng, first_row, file_offset).tolist()))
+
+    elif column.kind == "randint":
+        return list(map(str, np.asarray(create_column_values(column, batch_size, rng)).tolist()))
+
+    elif column.kind == "choice":
+        encoded_choices = np.array([json.dumps(choice) for choice in column.value], dtype=object)
+        return encoded_choices[rng.integers(0, len(column.value), size=batch_size)].tolist()
+
+    elif column.kind == "weighted":
+        encoded_choices = np.array([json.dumps(choice) for choice in column.value.choices], dtype=object)
+        return encoded_choices[weighted_indexes(column.value, batch_size, rng)].tolist()
+
+    elif column.kind == "faker":
+        pool = faker_pools.encoded_pool(column.value)
+        return [pool[index] for index in rng.integers(0, len(pool), size=batch_size).tolist()]
+
+    elif column.kind == "uuid":
+        return numpy_bulk_uuids(rng, batch_size, quoted=True)
+
+    return [json.dumps(column.value)] * batch_size
+
+
+def create_data_batch(compiled_schema, batch_size, rng, template=None, first_row=0, file_offset=0):
+    if template is None:
+        template = jsonl_template(compiled_schema)
+
+    # constants are already a part of the template
+    columns = [create_column_batch(column, batch_size, rng, first_row, file_offset)
+               for column in dynamic_columns(compiled_schema)]
+    if not columns:
+        return template.format() * batch_size
+    return "".join(map(template.format, *columns))
+
+
+def python_rng(options, stream):
+    # every chunk of every file (the stream) takes its values from its own generator, seeded with --seed, the index of
+    # the file and the index of the chunk - so the data doesn't depend on which process creates which chunk
+    if options.seed is None:
+        return random.Random()
+    return random.Random("{}:{}:{}".format(options.seed, *stream))
+
+
+def numpy_rng(options, stream):
+    if options.seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([options.seed, *stream])
+
+
+def stream_first_row(options, stream):
+    # every stream but the last one of a file has chunk_lines lines, so the number of its first row in the file is
+    # known without creating the ones before it - streams printed out are chunks of batch_size lines
+    return stream[1] * options.chunk_lines
+
+
+def stream_file_offset(options, stream):
+    # files of a run have file_lines lines each, so the rows of every file have their own range of numbers in the run
+    return stream[0] * options.file_lines
+
+
+def python_engine(compiled_schema, options, stream=(0, 0)):
+    return SERIALIZERS[options.serializer](compiled_schema, python_rng(options, stream),
+                                           stream_first_row(options, stream), stream_file_offset(options, stream))
+
+
+def numpy_engine(compiled_schema, options, stream=(0, 0)):
+    rng = numpy_rng(options, stream)
+    template = jsonl_template(compiled_schema)
+    next_row = [stream_first_row(options, stream)]
+    reset_clock()
+
+    def create_lines(lines_count):
+        lines = create_data_batch(compiled_schema, lines_count, rng, template, next_row[0],
+                                  stream_file_offset(options, stream))
+        next_row[0] += lines_count
+        return lines
+
+    return create_lines
+
+
+# every engine returns a function creating a string with the given number of json lines
+ENGINES = {"python": python_engine, "numpy": numpy_engine}
+
+
+def python_values_engine(compiled_schema, options, stream=(0, 0)):
+    generators = bind_generators(compiled_schema, python_rng(options, stream), stream_first_row(options, stream),
+                                 stream_file_offset(options, stream))
+
+    def create_columns(batch_size):
+        return [[generate() for _ in range(batch_size)] if column.kind != "const" else [column.value] * batch_size
+                for column, (_, generate) in zip(compiled_schema, generators)]
+
+    return create_columns
+
+
+def numpy_values_engine(compiled_schema, options, stream=(0, 0)):
+    rng = numpy_rng(options, stream)
+    next_row = [stream_first_row(options, stream)]
+    reset_clock()
+
+    def create_columns(batch_size):
+        columns = [create_column_values(column, batch_size, rng, next_row[0], stream_file_offset(options, stream))
+                   for column in compiled_schema]
+        next_row[0] += batch_size
+        return columns
+
+    return create_columns
+
+
+# every values engine returns a function creating a list of columns (lists or numpy arrays of values) for the given
+# number of lines - used by the formats other than jsonl
+VALUES_ENGINES = {"python": python_values_engine, "numpy": numpy_values_engine}
+
+# settings of how the data is created and written, shared by every file (or chunk of a file) of a single run
+OutputOptions = namedtuple("OutputOptions", ["engine", "batch_size", "serializer", "chunk_lines", "compression",
+                                             "compression_level", "file_format", "seed", "profile", "write_queue",
+                                             "write_buffer", "fsync", "file_lines", "stats"],
+                           defaults=["python", 100000, "template", 1000000, "none", 6, "jsonl", None, None, 2,
+                                     1048576, False, 0, False])
+
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+# extensions of every file that could have been created by datagen: plain or compressed jsonl and csv files and npz
+OUTPUT_EXTENSIONS = tuple("." + file_format + compression for file_format in ["jsonl", "csv"]
+                          for compression in COMPRESSION_EXTENSIONS.values()) + (".npz",)
+
+
+def output_extension(options):
+    if options.file_format == "npz":
+        # npz is a zip archive, which is compressed on its own
+        return ".npz"
+    return "." + options.file_format + COMPRESSION_EXTENSIONS[options.compression]
+
+
+def python_rows_engine(compiled_schema, options, stream=(0, 0)):
+    # the same values as python_engine, created row by row (unlike python_values_engine) but returned as columns
+    generators = bind_generators(compiled_schema, python_rng(options, stream), stream_first_row(options, stream),
+                                 stream_file_offset(options, stream))
+
+    def create_columns(batch_size):
+        rows = [[generate() for _, generate in generators] for _ in range(batch_size)]
+        return [list(values) for values in zip(*rows)] if rows else [[] for _ in compiled_schema]
+
+    return create_columns
+
+
+def observed_jsonl_format(compiled_schema, options, stream, observe):
+    # the values are created first and passed to observe, then encoded into the template - the lines are the same
+    # as the ones of jsonl_format
+    create_columns = (python_rows_engine if options.engine == "python" else numpy_values_engine)(
+        compiled_schema, options, stream)
+    template = jsonl_template(compiled_schema)
+    encoders = [(index, VALUE_ENCODERS.get(column.kind, _encode_value))
+                for index, column in enumerate(compiled_schema) if column.kind != "const"]
+
+    def create_block(lines_count):
+        start = time.perf_counter()
+        columns = create_columns(lines_count)
+        created = time.perf_counter()
+        observe(columns)
+        if encoders:
+            lines = "".join(map(template.format, *[list(map(encode, _as_list(columns[index])))
+                                                   for index, encode in encoders]))
+        else:
+            lines = template.format() * lines_count
+        block = lines.encode()
+        metrics.add(metrics.GENERATE, created - start)
+        metrics.add(metrics.SERIALIZE, time.perf_counter() - created)
+        return block
+
+    return create_block
+
+
+def jsonl_format(compiled_schema, options, stream=(0, 0), observe=None):
+    # observe (if given) gets every batch of values as columns before they are written
+    if observe is not None:
+        return observed_jsonl_format(compiled_schema, options, stream, observe)
+    create_lines = ENGINES[options.engine](compiled_schema, options, stream)
+
+    def create_block(lines_count):
+        start = time.perf_counter()
+        lines = create_lines(lines_count)
+        created = time.perf_counter()
+        block = lines.encode()
+        metrics.add(metrics.GENERATE, created - start)
+        metrics.add(metrics.SERIALIZE, time.perf_counter() - created)
+        return block
+
+    return create_block
+
+
+def csv_format(compiled_schema, options, stream=(0, 0), observe=None):
+    create_columns = VALUES_ENGINES[options.engine](compiled_schema, options, stream)
+    # only the columns taking values from the schema can have lists, dicts or booleans
+    encoded = [column.kind in ("choice", "weighted", "const") for column in compiled_schema]
+
+    def create_block(lines_count):
+        start = time.perf_counter()
+        columns = [_as_list(values) for values in create_columns(lines_count)]
+        created = time.perf_counter()
+        if observe is not None:
+            observe(columns)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(*[csv_values(values) if is_encoded else values
+                                           for values, is_encoded in zip(columns, encoded)]))
+        block = buffer.getvalue().encode()
+        metrics.add(metrics.GENERATE, created - start)
+        metrics.add(metrics.SERIALIZE, time.perf_counter() - created)
+        return block
+
+    return create_block
+
+
+# types of values which csv would write as their python text
+JSON_ENCODED = (list, tuple, dict, bool)
+
+
+def csv_values(values):
+    # lists, dicts and booleans are written as json, the same as in the other formats, instead of their python text
+    if any(type(value) in JSON_ENCODED for value in values):
+        return [json.dumps(value) if type(value) in JSON_ENCODED else value for value in values]
+    return values
+
+
+def _as_list(values):
+    return values.tolist() if np is not None and isinstance(values, np.ndarray) else values
+
+
+def format_header(compiled_schema, options):
+    if options.file_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow([column.key for column in compiled_schema])
+        return buffer.getvalue().encode()
+    return b""
+
+
+# every format returns a function creating bytes with the given number of lines - npz can't be written in blocks,
+# so it has its own write_npz_file function
+FORMATS = {"jsonl": jsonl_format, "csv": csv_format}
+
+
+def npz_values(column, values):
+    # typed array of the values of a single column, with json text as the last resort for mixed values
+    if column.kind in ("timestamp", "time_range"):
+        return np.asarray(values, dtype=np.float64)
+    if column.type == "int" or column.type == "float":
+        # ints first, then floats - missing (None) values become nan
+        for dtype in ([np.int64] if column.type == "int" else []) + [np.float64]:
+            try:
+                return np.asarray(values, dtype=dtype)
+            except (TypeError, ValueError, OverflowError):
+                pass
+    elif isinstance(values, np.ndarray) and values.dtype.kind == "U":
+        # already strings - np.str_ values of numpy columns aren't of the type str
+        return values
+    elif all(type(value) is str for value in values):
+        return np.asarray(values, dtype=str)
+    return np.asarray([json.dumps(_as_list(value)) for value in values], dtype=str)
+
+
+def npz_arrays(column, values):
+    # strings from a list of choices are dictionary encoded: indexes in "<key>" and the values in "<key>.categories"
+    if column.kind in ("choice", "weighted", "faker") and values.dtype.kind == "U":
+        categories, codes = np.unique(values, return_inverse=True)
+        return {column.key: codes.astype(np.int32), column.key + ".categories": categories}
+    return {column.key: values}
+
+
+def write_npz_file(file_path, compiled_schema, chunks, options, observe=None):
+    # npz keeps every column as a whole array, so the whole file is kept in memory before writing it
+    columns = [[] for _ in compiled_schema]
+    for file_index, chunk_index, chunk_lines in chunks:
+        create_columns = VALUES_ENGINES[options.engine](compiled_schema, options, (file_index, chunk_index))
+        for batch_start in range(0, chunk_lines, options.batch_size):
+            start = time.perf_counter()
+            batch_columns = create_columns(min(options.batch_size, chunk_lines - batch_start))
+            profile.checkpoint()
+            created = time.perf_counter()
+            if observe is not None:
+                observe(batch_columns)
+            for column, batch_values, values in zip(compiled_schema, columns, batch_columns):
+                batch_values.append(npz_values(column, values))
+            metrics.add(metrics.GENERATE, created - start)
+            metrics.add(metrics.SERIALIZE, time.perf_counter() - created)
+
+    start = time.perf_counter()
+    size = 0
+    compression = zipfile.ZIP_STORED if options.compression == "none" else zipfile.ZIP_DEFLATED
+    with open(file_path, "wb", buffering=options.write_buffer) as raw_file:
+        with zipfile.ZipFile(raw_file, "w", compression=compression) as npz_file:
+            for column, batch_values in zip(compiled_schema, columns):
+                values = np.concatenate(batch_values) if batch_values else np.empty(0)
+                for name, array in npz_arrays(column, values).items():
+                    with npz_file.open(name + ".npy", "w", force_zip64=True) as array_file:
+                        np.lib.format.write_array(array_file, array, allow_pickle=False)
+                    size += array.nbytes
+        if options.fsync:
+            sync_file(raw_file)
+    metrics.add_batch(sum(chunk[2] for chunk in chunks), size, time.perf_counter() - start)
+
+
+def compressed_writer(raw_file, options):
+    # every compressed file (or chunk) is a complete stream, so chunks compressed separately can simply be
+    # concatenated - gzip, bzip2 and xz all read concatenated streams as a single one
+    if options.compression == "gzip":
+        # no file name and time in the header, so the same data always gives the same file
+        return gzip.GzipFile(filename="", mode="wb", compresslevel=options.compression_level, fileobj=raw_file,
+                             mtime=0)
+    elif options.compression == "bz2":
+        return bz2.BZ2File(raw_file, "wb", compresslevel=options.compression_level)
+    elif options.compression == "xz":
+        return lzma.LZMAFile(raw_file, "wb", preset=options.compression_level)
+    return raw_file
+
+
+def stream_writer(raw_file, options):
+    # (write, close) of a single compressed stream, meant to be called by the writer thread - the stream is opened by
+    # the first write, because gzip writes its header to the file as soon as it's opened
+    stream = []
+
+    def write(block):
+        if not stream:
+            stream.append(compressed_writer(raw_file, options))
+        stream[0].write(block)
+
+    def close():
+        if stream and stream[0] is not raw_file:
+            stream[0].close()
+
+    return write, close
+
+
+def _timed_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    metrics.add(metrics.WRITE, time.perf_counter() - start)
+
+
+# writer threads of the current process by the size of their queue - a thread is started by the first file and reused
+# by the next ones, so small files don't pay for starting and joining a thread each
+_writers = {}
+
+
+def _run_writer(calls):
+    while True:
+        errors, call = calls.get()
+        # after an error the calls of the file are only taken out of the queue, so that submit can't block forever
+        if not errors:
+            try:
+                _timed_call(*call)
+            except Exception as error:
+                errors.append(error)
+        calls.task_done()
+
+
+def _writer_queue(queue_size):
+    # a forked process gets the threads of its parent as stopped, so it starts its own one
+    if queue_size not in _writers or not _writers[queue_size][1].is_alive():
+        calls = queue.Queue(queue_size)
+        thread = threading.Thread(target=_run_writer, args=(calls,), daemon=True)
+        thread.start()
+        _writers[queue_size] = calls, thread
+    return _writers[queue_size][0]
+
+
+@contextmanager
+def background_writer(queue_size):
+    # gives submit(function, *args) - the calls (compressing and writing the blocks) are made in order by a separate
+    # thread, so the next block is created while the previous one is written, and at most queue_size blocks wait for
+    # it; with queue_size 0 every call is made right away
+    if queue_size == 0:
+        yield _timed_call
+        return
+
+    calls = _writer_queue(queue_size)
+    errors = []
+
+    def submit(function, *args):
+        if errors:
+            raise errors[0]
+        calls.put((errors, (function, *args)))
+
+    try:
+        yield submit
+    finally:
+        # everything submitted is written before the file is closed, even if creating the data failed
+        calls.join()
+    if errors:
+        raise errors[0]
+
+
+def sync_file(opened_file):
+    opened_file.flush()
+    os.fsync(opened_file.fileno())
+
+
+def file_chunks(file_index, data_lines, chunk_lines):
+    # (index of the file, index of the chunk, number of lines in the chunk) for every chunk of a file
+    return [(file_index, chunk_index, min(chunk_lines, data_lines - chunk_start))
+            for chunk_index, chunk_start in enumerate(range(0, data_lines, chunk_lines))]
+
+
+def write_output_file(file_path, compiled_schema, chunks, options):
+    # with --stats the statistics of the written lines are saved next to the file
+    file_stats = stats.create_stats(compiled_schema) if options.stats else None
+    observe = stats.observer(file_stats, compiled_schema) if options.stats else None
+
+    if options.file_format == "npz":
+        write_npz_file(file_path, compiled_schema, chunks, options, observe)
+    else:
+        with open(file_path, "wb", buffering=options.write_buffer) as raw_file:
+            with background_writer(options.write_queue) as submit:
+                for chunk in chunks:
+                    # every chunk is compressed as a separate stream, the same as when it's created by a different
+                    # process
+                    write, close = stream_writer(raw_file, options)
+                    write_data(partial(submit, write), compiled_schema, chunk, options, observe)
+                    submit(close)
+            if options.fsync:
+                sync_file(raw_file)
+
+    if options.stats:
+        stats.write_stats(stats.stats_path(file_path), file_stats)
+
+
+def write_data(write, compiled_schema, chunk, options, observe=None):
+    # lines are written in batches of batch_size lines to avoid calling write for every single line
+    file_index, chunk_index, chunk_lines = chunk
+    create_block = FORMATS[options.file_format](compiled_schema, options, (file_index, chunk_index), observe)
+
+    # only the first chunk of a file starts with the header
+    if chunk_index == 0:
+        write(format_header(compiled_schema, options))
+    for batch_start in range(0, chunk_lines, options.batch_size):
+        batch_lines = min(options.batch_size, chunk_lines - batch_start)
+        block = create_block(batch_lines)
+        profile.checkpoint()
+        write(block)
+        # the time of writing is counted by the writer, which may be another thread
+        metrics.add(metrics.ROWS, batch_lines)
+        metrics.add(metrics.BYTES, len(block))
+
+
+def file_exists_warning(this_file_name, path_to_save_files):
     if os.path.exists(os.path.join(path_to_save_files, this_file_name)):
         logging.warning(f"File {this_file_name} wasn't created, because file with this name already exists. To clear "
                         f" output directory from all files containing your file name, use --clear_path flag.")
+        return True
+    return False
+
+
+def create_file_with_data(this_file_name, path_to_save_files, compiled_schema, data_lines, options=OutputOptions(),
+                          file_index=0):
+    if file_exists_warning(this_file_name, path_to_save_files):
+        return 0
+    # the file gets its name only once it's complete, so a killed run never leaves a cut off file behind
+    temporary_path = os.path.join(path_to_save_files, temporary_file_name(this_file_name))
+    write_output_file(temporary_path, compiled_schema, file_chunks(file_index, data_lines, options.chunk_lines),
+                      options)
+    if options.stats:
+        stats.commit_stats(temporary_path, os.path.join(path_to_save_files, this_file_name))
+    os.replace(temporary_path, os.path.join(path_to_save_files, this_file_name))
+    return data_lines
+
+
+def temporary_file_name(this_file_name):
+    directory, base_name = os.path.split(this_file_name)
+    return os.path.join(directory, f".{base_name}.tmp")
+
+
+def part_file_name(this_file_name, chunk_index):
+    # this_file_name can be inside of a shard directory
+    directory, base_name = os.path.split(this_file_name)
+    return os.path.join(directory, f".{base_name}.part{chunk_index}")
+
+
+def split_into_chunks(indexed_files, data_lines, chunk_lines):
+    # (file name, chunk) for every chunk of every (index of the file, file name) given
+    return [(this_file_name, chunk) for file_index, this_file_name in indexed_files
+            for chunk in file_chunks(file_index, data_lines, chunk_lines)]
+
+
+def create_file_chunk(file_chunk, path_to_save_files, compiled_schema, options=OutputOptions()):
+    this_file_name, chunk = file_chunk
+    write_output_file(os.path.join(path_to_save_files, part_file_name(this_file_name, chunk[1])), compiled_schema,
+                      [chunk], options)
+    return chunk[2]
+
+
+def _copy_file_range(source_fd, target_fd, count):
+    return os.copy_file_range(source_fd, target_fd, count)
+
+
+def _sendfile(source_fd, target_fd, count):
+    return os.sendfile(target_fd, source_fd, None, count)
+
+
+# ways of copying data between files without passing it through python, from the fastest one
+COPY_FUNCTIONS = [function for function, name in [(_copy_file_range, "copy_file_range"), (_sendfile, "sendfile")]
+                  if hasattr(os, name)]
+
+
+def append_file(target_file, source_path):
+    with open(source_path, "rb") as source_file:
+        remaining = os.fstat(source_file.fileno()).st_size
+
+        for copy_function in COPY_FUNCTIONS:
+            try:
+                while remaining > 0:
+                    copied = copy_function(source_file.fileno(), target_file.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except OSError:
+                # not supported for these files (e.g. by the file system), the next way will be used
+                continue
+            if remaining == 0:
+                return
+
+        shutil.copyfileobj(source_file, target_file)
+
+
+def merge_chunk_stats(this_file_name, path_to_save_files, chunks_count):
+    part_paths = [stats.stats_path(os.path.join(path_to_save_files, part_file_name(this_file_name, chunk_index)))
+                  for chunk_index in range(chunks_count)]
+    stats.write_stats(stats.stats_path(os.path.join(path_to_save_files, this_file_name)),
+                      stats.merge_files(part_paths))
+    for part_path in part_paths:
+        os.remove(part_path)
+
+
+def merge_chunks(this_file_name, path_to_save_files, chunks_count, fsync=False, merge_stats=False):
+    # the first chunk becomes the file, the rest of them are appended to it in order - under a temporary name until
+    # the whole file is there
+    temporary_path = os.path.join(path_to_save_files, temporary_file_name(this_file_name))
+    if merge_stats:
+        merge_chunk_stats(this_file_name, path_to_save_files, chunks_count)
+    os.replace(os.path.join(path_to_save_files, part_file_name(this_file_name, 0)), temporary_path)
+
+    with open(temporary_path, "r+b", buffering=0) as this_file:
+        this_file.seek(0, os.SEEK_END)
+        for chunk_index in range(1, chunks_count):
+            part_path = os.path.join(path_to_save_files, part_file_name(this_file_name, chunk_index))
+            append_file(this_file, part_path)
+            os.remove(part_path)
+        if fsync:
+            sync_file(this_file)
+    os.replace(temporary_path, os.path.join(path_to_save_files, this_file_name))
+
+
+# lines a single task sent to a worker should have at least, so that small files don't cost a round trip each
+TASK_LINES = 100000
+
+# seconds of work a process should get at least to be worth starting, used by --multiprocessing auto
+AUTO_SECONDS_PER_PROCESS = 0.5
+
+# state of a worker process, set once by init_worker instead of being sent with every task
+_worker_state = {}
+
+
+def init_worker(compiled_schema, path_to_save_files, options, counters, main=False, rolling=None):
+    _worker_state["compiled_schema"] = compiled_schema
+    _worker_state["rolling"] = rolling
+    _worker_state["path_to_save_files"] = path_to_save_files
+    _worker_state["options"] = options
+    metrics.attach(counters, main)
+    if path_to_save_files is not None:
+        profile.start(options.profile, path_to_save_files)
+
+
+def create_work_unit(unit):
+    return profile.run(_create_work_unit, unit)
+
+
+def _create_work_unit(unit):
+    # ("file", index of the file, file name, number of lines) or ("chunk", file name, chunk) - returns the name of the
+    # finished file (None for chunks and skipped files), the number of created lines and the name of the file of the
+    # finished chunk (None for files)
+    if unit[0] == "file":
+        _, file_index, this_file_name, data_lines = unit
+        created_lines = create_file_with_data(this_file_name, _worker_state["path_to_save_files"],
+                                              _worker_state["compiled_schema"], data_lines, _worker_state["options"],
+                                              file_index)
+        if created_lines:
+            metrics.add(metrics.FILES, 1)
+            return this_file_name, created_lines, None
+        return None, 0, None
+    return None, create_file_chunk(unit[1:], _worker_state["path_to_save_files"], _worker_state["compiled_schema"],
+                                   _worker_state["options"]), unit[1]
+
+
+def collect_results(results, manifest, chunk_done=None):
+    # sums up the created lines and records the finished files as soon as any of them is done - chunk_done gets the
+    # name of the file of every finished chunk
+    created_lines = 0
+    for finished_file, lines, chunked_file in results:
+        created_lines += lines
+        if finished_file is not None:
+            manifests.record_file(manifest, finished_file, lines)
+        if chunked_file is not None:
+            chunk_done(chunked_file)
+    return created_lines
+
+
+def create_worker_block(block):
+    # the number of lines goes back with the data, so that the main process can count the written rows
+    return block[1], create_data_block(block, _worker_state["compiled_schema"], _worker_state["options"])
+
+
+def dispatch_chunksize(units_count, unit_lines, num_of_processes):
+    # small units are sent in groups of about TASK_LINES lines, but at least 4 tasks per process are left, so that
+    # the processes finishing early can take over the rest instead of waiting for a long tail of the others
+    chunksize = TASK_LINES // max(unit_lines, 1)
+    return max(1, min(chunksize, units_count // (4 * num_of_processes)))
+
+
+def run_work_units(units, unit_lines, compiled_schema, path_to_save_files, num_of_processes, options, counters,
+                   progress_interval=0, manifest=None, chunk_done=None):
+    if num_of_processes == 1 or len(units) <= 1:
+        init_worker(compiled_schema, path_to_save_files, options, counters, main=True)
+        with metrics.progress(counters, progress_interval):
+            return collect_results(map(create_work_unit, units), manifest, chunk_done)
+
+    chunksize = dispatch_chunksize(len(units), unit_lines, num_of_processes)
+    with multiprocessing.Pool(num_of_processes, initializer=init_worker,
+                              initargs=(compiled_schema, path_to_save_files, options, counters)) as pool:
+        # the progress thread starts only after the workers are forked
+        with metrics.progress(counters, progress_interval):
+            return collect_results(pool.imap_unordered(create_work_unit, units, chunksize), manifest, chunk_done)
+
+
+def create_chunked_files(files_to_create, path_to_save_files, compiled_schema, data_lines, num_of_processes,
+                         options, counters, progress_interval=0, manifest=None, skip=frozenset()):
+    indexed_files = [(file_index, this_file_name) for file_index, this_file_name in enumerate(files_to_create)
+                     if this_file_name not in skip and not file_exists_warning(this_file_name, path_to_save_files)]
+    chunks = split_into_chunks(indexed_files, data_lines, options.chunk_lines)
+    logging.info(f"Splitting every file into {len(chunks) // max(len(indexed_files), 1)} chunks created "
+                 f"in parallel")
+
+    # every file is merged and recorded as soon as its last chunk is done, so a killed run keeps the finished files
+    chunks_count = -(-data_lines // options.chunk_lines)
+    chunks_left = {this_file_name: chunks_count for _, this_file_name in indexed_files}
+
+    def chunk_done(this_file_name):
+        chunks_left[this_file_name] -= 1
+        if chunks_left[this_file_name] == 0:
+            merge_chunks(this_file_name, path_to_save_files, chunks_count, options.fsync, options.stats)
+            metrics.add(metrics.FILES, 1)
+            manifests.record_file(manifest, this_file_name, data_lines)
+
+    units = [("chunk", this_file_name, chunk) for this_file_name, chunk in chunks]
+    metrics.attach(counters, main=True)
+    return run_work_units(units, options.chunk_lines, compiled_schema, path_to_save_files, num_of_processes, options,
+                          counters, progress_interval, chunk_done=chunk_done)
+
+
+def create_files(files_to_create, path_to_save_files, compiled_schema, data_lines, num_of_processes,
+                 options=OutputOptions(), counters=None, progress_interval=0, manifest=None, skip=frozenset()):
+    # files in 'skip' were created by the resumed run - the rest keep their indexes, so that they get the same data
+    if counters is None:
+        counters = metrics.create_counters(num_of_processes)
+    options = options._replace(file_lines=data_lines)
+
+    # files bigger than chunk_lines are split, so that a few huge files can still use every process
+    if num_of_processes > 1 and data_lines > options.chunk_lines and options.file_format != "npz":
+        return create_chunked_files(files_to_create, path_to_save_files, compiled_schema, data_lines,
+                                    num_of_processes, options, counters, progress_interval, manifest, skip)
+
+    units = [("file", file_index, this_file_name, data_lines)
+             for file_index, this_file_name in enumerate(files_to_create) if this_file_name not in skip]
+    return run_work_units(units, data_lines, compiled_schema, path_to_save_files, num_of_processes, options,
+                          counters, progress_interval, manifest)
+
+
+# limits of a rolling run - total bytes of all the files, bytes and lines of a single file (0 is no limit), the bytes
+# are counted before compression
+RollingLimits = namedtuple("RollingLimits", ["target_bytes", "file_bytes", "rows_per_file"])
+
+# everything the name of the file with a given index depends on - "multiplier" and "offset" shuffle the random suffixes
+FileNaming = namedtuple("FileNaming", ["file_name", "suffix", "extension", "seed", "shard_dirs", "multiplier",
+                                       "offset"])
+
+# random suffixes of rolling files are numbers from 1 to RANDOM_SUFFIXES, the next files get bigger ones
+RANDOM_SUFFIXES = 999999
+
+# lines in the first batch of a rolling file, used to find out the size of a line
+ROLLING_PROBE_LINES = 1000
+
+
+def file_naming(file_name, suffix, extension=".jsonl", seed=None, shard_dirs=0):
+    # the number of files isn't known in advance, so random suffixes are (multiplier * index + offset) modulo the number
+    # of the suffixes - different for every index, with a multiplier having no common divisor with it
+    rng = random.Random(seed)
+    multiplier = rng.randrange(1, RANDOM_SUFFIXES)
+    while math.gcd(multiplier, RANDOM_SUFFIXES) != 1:
+        multiplier = rng.randrange(1, RANDOM_SUFFIXES)
+    return FileNaming(file_name, suffix, extension, seed, shard_dirs, multiplier, rng.randrange(RANDOM_SUFFIXES))
+
+
+def lazy_file_name(naming, file_index):
+    # name of a single file, created only when a process is about to write it
+    if naming.suffix == "count":
+        number = str(file_index + 1)
+    elif naming.suffix == "random":
+        number = str((naming.multiplier * file_index + naming.offset) % RANDOM_SUFFIXES + 1 if
+                     file_index < RANDOM_SUFFIXES else file_index + 1)
     else:
-        new_file = open(os.path.join(path_to_save_files, this_file_name), "w+")
-        str_of_dicts = ""
+        seed = None if naming.seed is None else f"{naming.seed}:name:{file_index}"
+        number = _rand_uuid(random.Random(seed).getrandbits)
+
+    this_file_name = naming.file_name + number + naming.extension
+    if naming.shard_dirs > 0:
+        return os.path.join(shard_dir_name(this_file_name, naming.shard_dirs), this_file_name)
+    return this_file_name
+
+
+def create_rolling_state():
+    # shared by all the processes - index of the next free file and bytes written by all of them
+    return {"next_file": multiprocessing.Value("q", 0), "written": multiprocessing.Value("q", 0)}
+
+
+def claim_file_index(state):
+    with state["next_file"].get_lock():
+        file_index = state["next_file"].value
+        state["next_file"].value += 1
+    return file_index
+
+
+def _rolling_batch_lines(limit, written, line_bytes):
+    # lines that should be enough to reach the limit of bytes, judging by the lines already created - the first batch
+    # of a file is small, so that the size of a line is known before a whole batch is created
+    if not limit:
+        return None
+    if line_bytes is None:
+        return ROLLING_PROBE_LINES
+    return max(1, -(-(limit - written) // line_bytes))
+
+
+def write_rolling_file(file_path, compiled_schema, file_index, options, limits, state):
+    # writes chunks of the file until any of the limits is reached, returns the number of lines
+    lines, size, line_bytes = 0, 0, None
+    file_stats = stats.create_stats(compiled_schema) if options.stats else None
+    observe = stats.observer(file_stats, compiled_schema) if options.stats else None
+
+    def full():
+        return (limits.rows_per_file and lines >= limits.rows_per_file) or \
+            (limits.file_bytes and size >= limits.file_bytes) or state["written"].value >= limits.target_bytes
+
+    with open(file_path, "wb", buffering=options.write_buffer) as raw_file:
+        with background_writer(options.write_queue) as submit:
+            chunk_index = 0
+            while not full():
+                # the same streams of random values as chunks of a file of a known size
+                write, close = stream_writer(raw_file, options)
+                create_block = FORMATS[options.file_format](compiled_schema, options, (file_index, chunk_index),
+                                                            observe)
+                if chunk_index == 0:
+                    submit(write, format_header(compiled_schema, options))
+
+                chunk_lines = 0
+                while chunk_lines < options.chunk_lines and not full():
+                    batch_lines = min([options.batch_size, options.chunk_lines - chunk_lines] + [
+                        limit for limit in [limits.rows_per_file and limits.rows_per_file - lines,
+                                            _rolling_batch_lines(limits.file_bytes, size, line_bytes),
+                                            _rolling_batch_lines(limits.target_bytes, state["written"].value,
+                                                                 line_bytes)] if limit])
+                    block = create_block(batch_lines)
+                    profile.checkpoint()
+                    submit(write, block)
+                    metrics.add(metrics.ROWS, batch_lines)
+                    metrics.add(metrics.BYTES, len(block))
+
+                    chunk_lines += batch_lines
+                    lines += batch_lines
+                    size += len(block)
+                    line_bytes = max(1, size // lines)
+                    with state["written"].get_lock():
+                        state["written"].value += len(block)
+                submit(close)
+                chunk_index += 1
+        if options.fsync:
+            sync_file(raw_file)
+    if options.stats:
+        stats.write_stats(stats.stats_path(file_path), file_stats)
+    return lines
+
+
+def roll_files(_):
+    # files are taken one by one by any process that is free, until all of them together reach the target
+    naming, limits, state = _worker_state["rolling"]
+    path_to_save_files = _worker_state["path_to_save_files"]
+    created_files = []
+    while state["written"].value < limits.target_bytes:
+        file_index = claim_file_index(state)
+        this_file_name = lazy_file_name(naming, file_index)
+        if file_exists_warning(this_file_name, path_to_save_files):
+            continue
+
+        temporary_path = os.path.join(path_to_save_files, temporary_file_name(this_file_name))
+        lines = write_rolling_file(temporary_path, _worker_state["compiled_schema"], file_index,
+                                   _worker_state["options"], limits, state)
+        if lines == 0:
+            # the target was reached by other processes before this file got any lines - with more processes the last
+            # few indexes can be left unused this way
+            os.remove(temporary_path)
+            if _worker_state["options"].stats:
+                os.remove(stats.stats_path(temporary_path))
+            break
+        if _worker_state["options"].stats:
+            stats.commit_stats(temporary_path, os.path.join(path_to_save_files, this_file_name))
+        os.replace(temporary_path, os.path.join(path_to_save_files, this_file_name))
+        metrics.add(metrics.FILES, 1)
+        created_files.append((this_file_name, lines))
+    return created_files
+
+
+def create_rolling_files(path_to_save_files, compiled_schema, naming, limits, num_of_processes,
+                         options=OutputOptions(), counters=None, progress_interval=0):
+    # returns (name, number of lines) of every created file
+    if counters is None:
+        counters = metrics.create_counters(num_of_processes)
+    if has_unique_columns(compiled_schema) and not limits.rows_per_file:
+        # without a limit of lines the files can't be given disjoint parts of the unique values in advance
+        raise exc.IncompatibleOptions("Unique columns", "rolling files without --rows_per_file")
+    options = options._replace(file_lines=limits.rows_per_file)
+    rolling = (naming, limits, create_rolling_state())
+
+    if num_of_processes == 1:
+        init_worker(compiled_schema, path_to_save_files, options, counters, True, rolling)
+        with metrics.progress(counters, progress_interval):
+            return profile.run(roll_files, 0)
+
+    with multiprocessing.Pool(num_of_processes, initializer=init_worker,
+                              initargs=(compiled_schema, path_to_save_files, options, counters, False,
+                                        rolling)) as pool:
+        with metrics.progress(counters, progress_interval):
+            return list(chain.from_iterable(pool.map(partial(profile.run, roll_files), range(num_of_processes), 1)))
+
+
+def max_work_units(num_of_saving_files, data_lines, options):
+    # the most processes that can have something to do at once
+    if num_of_saving_files == 0:
+        return -(-data_lines // options.batch_size)
+    if options.file_format == "npz":
+        return num_of_saving_files
+    return num_of_saving_files * -(-data_lines // options.chunk_lines)
+
+
+def probe_schema(compiled_schema):
+    # throwaway lines would use up the values of small unique ranges, so they are created with ranges that can't run
+    # out - the same keys and number of bits, so the values cost the same and have about as many digits
+    probe_columns = []
+    for column in compiled_schema:
+        if column.kind in UNIQUE_KINDS:
+            probe_range = column.value._replace(size=MASK_64 + 1)
+            column = column._replace(value=probe_range, generator=partial(column.generator.func, probe_range))
+        probe_columns.append(column)
+    return probe_columns
+
+
+def measure_throughput(compiled_schema, options, seconds=0.1):
+    # lines per second created by a single process, measured on throwaway data
+    compiled_schema = probe_schema(compiled_schema)
+    measure_options = options._replace(file_format=options.file_format if options.file_format in FORMATS else "csv")
+    create_block = FORMATS[measure_options.file_format](compiled_schema, measure_options, (0, 0))
+    block_lines = min(options.batch_size, 1000)
+
+    created_lines = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        create_block(block_lines)
+        created_lines += block_lines
+    return created_lines / (time.perf_counter() - start)
+
+
+def auto_processes(compiled_schema, options, total_lines, work_units):
+    lines_per_second = measure_throughput(compiled_schema, options)
+    num_of_processes = int(total_lines / lines_per_second / AUTO_SECONDS_PER_PROCESS)
+    num_of_processes = max(1, min(num_of_processes, os.cpu_count(), work_units))
+    logging.info(f"Measured {lines_per_second:.0f} lines/s per process, using {num_of_processes} processes")
+    return num_of_processes
+
+
+def create_data_block(block, compiled_schema, options=OutputOptions()):
+    # every block printed out is a separate stream of random values, like a chunk of a file
+    block_index, block_lines = block
+    return FORMATS[options.file_format](compiled_schema, options._replace(chunk_lines=options.batch_size),
+                                        (0, block_index))(block_lines)
+
+
+def stream_blocks(pool, blocks, window, ordered=True):
+    # at most 'window' blocks are created or waiting to be written at once, so that a slow reader of the output
+    # stops the workers instead of filling up the memory
+    blocks = iter(blocks)
+    finished = queue.Queue()
+    pending = deque()
+
+    def submit():
+        block = next(blocks, None)
+        if block is not None:
+            # ordered blocks are taken from their own results, so only the unordered ones go through 'finished' -
+            # otherwise it would keep every block of the run
+            callbacks = {} if ordered else {"callback": finished.put, "error_callback": finished.put}
+            pending.append(pool.apply_async(create_worker_block, (block,), **callbacks))
+
+    for _ in range(window):
+        submit()
+
+    while pending:
+        if ordered:
+            block = pending.popleft().get()
+        else:
+            pending.pop()
+            block = finished.get()
+            if isinstance(block, Exception):
+                raise block
+        submit()
+        yield block
+
+
+def stream_to_stdout(compiled_schema, data_lines, num_of_processes, options=OutputOptions(), ordered=True,
+                     counters=None, progress_interval=0):
+    if counters is None:
+        counters = metrics.create_counters(num_of_processes)
+    metrics.attach(counters, main=True)
+
+    blocks = list(enumerate(min(options.batch_size, data_lines - block_start)
+                            for block_start in range(0, data_lines, options.batch_size)))
+    sys.stdout.flush()
+    output = sys.stdout.buffer
+
+    def write_block(block_lines, block):
+        # the blocks are written by the main process, so the rows and bytes are counted here
+        start = time.perf_counter()
+        output.write(block)
+        metrics.add_batch(block_lines, len(block), time.perf_counter() - start)
+
+    try:
+        output.write(format_header(compiled_schema, options))
+        if num_of_processes > 1 and len(blocks) > 1:
+            with multiprocessing.Pool(num_of_processes, initializer=init_worker,
+                                      initargs=(compiled_schema, None, options, counters)) as pool:
+                with metrics.progress(counters, progress_interval):
+                    for block_lines, block in stream_blocks(pool, blocks, 2 * num_of_processes, ordered):
+                        write_block(block_lines, block)
+        else:
+            with metrics.progress(counters, progress_interval):
+                for block in blocks:
+                    write_block(block[1], create_data_block(block, compiled_schema, options))
+        output.flush()
+
+    except BrokenPipeError:
+        # the reader closed the pipe (e.g. "| head"), so the rest of the data isn't needed - stdout is redirected to
+        # devnull, so that python doesn't fail again while flushing it at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, output.fileno())
+        logging.info("Output pipe was closed by the reader, stopping")
 
-        for _ in range(data_lines):
-            current_line = create_data_line(data_schema)
-            new_file.write(json.dumps(current_line) + "\n")
 
-        json.dump(str_of_dicts, new_file)
+# library api - the data created in the calling process, without parsing any arguments or writing any files
 
+def library_options(count, engine="python", batch_size=100000, seed=None):
+    # the same checks as for the arguments of the command line
+    if count < 0:
+        raise exc.ValueNegative("Number of lines")
+    if batch_size < 1:
+        raise exc.ValueNegative("Batch size")
+    if engine not in VALUES_ENGINES:
+        raise exc.IncorrectValue(engine, f"one of the engines: {', '.join(VALUES_ENGINES)}")
+    if engine == "numpy" and np is None:
+        raise exc.MissingDependency("numpy", "the numpy engine")
+    return OutputOptions(engine=engine, batch_size=batch_size, seed=seed)
 
-def create_files(files_to_create, path_to_save_files, data_schema, data_lines, num_of_processes):
-    with multiprocessing.Pool(num_of_processes) as pool:
-        pool.map(partial(create_file_with_data, path_to_save_files=path_to_save_files, data_schema=data_schema,
-                         data_lines=data_lines), files_to_create)
+
+def library_streams(count, options):
+    # (stream, number of lines) of every chunk - the same streams of random values as of the first created file
+    return [((file_index, chunk_index), chunk_lines)
+            for file_index, chunk_index, chunk_lines in file_chunks(0, count, options.chunk_lines)]
+
+
+def iter_rows(data_schema, count, seed=None):
+    # lazily created rows as dicts - the schema is checked before the first one is asked for
+    compiled_schema = compile_data_schema(load_data_schema(data_schema), faker_pools.FakerOptions(seed=seed), seed)
+    options = library_options(count, seed=seed)
+
+    def rows():
+        for stream, chunk_lines in library_streams(count, options):
+            generators = bind_generators(compiled_schema, python_rng(options, stream),
+                                         stream_first_row(options, stream))
+            for _ in range(chunk_lines):
+                yield create_data_line(generators)
+
+    return rows()
+
+
+def iter_batches(data_schema, count, batch_size=100000, seed=None, engine="python"):
+    # batches of at most batch_size rows as {key: list (or numpy array) of values}
+    compiled_schema = compile_data_schema(load_data_schema(data_schema), faker_pools.FakerOptions(seed=seed), seed)
+    options = library_options(count, engine, batch_size, seed)
+    keys = [column.key for column in compiled_schema]
+
+    def batches():
+        for stream, chunk_lines in library_streams(count, options):
+            create_columns = VALUES_ENGINES[options.engine](compiled_schema, options, stream)
+            for batch_start in range(0, chunk_lines, batch_size):
+                yield dict(zip(keys, create_columns(min(batch_size, chunk_lines - batch_start))))
+
+    return batches()
+
+
+def write_jsonl(data_schema, count, file_object, seed=None, engine="python", batch_size=100000):
+    # writes the json lines to an already opened text or binary file and returns the number of written lines
+    compiled_schema = compile_data_schema(load_data_schema(data_schema), faker_pools.FakerOptions(seed=seed), seed)
+    options = library_options(count, engine, batch_size, seed)
+    text = isinstance(file_object, io.TextIOBase)
+
+    for stream, chunk_lines in library_streams(count, options):
+        create_lines = ENGINES[options.engine](compiled_schema, options, stream)
+        for batch_start in range(0, chunk_lines, batch_size):
+            lines = create_lines(min(batch_size, chunk_lines - batch_start))
+            file_object.write(lines if text else lines.encode())
+    return count
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
 
     try:
+        # "datagen verify <paths>" checks the files instead of creating them
+        if sys.argv[1:2] == ["verify"]:
+            verify_main(sys.argv[2:])
+            return
+
         parsed_args = parsing()
 
         warnings = {"timestamp_with_value_warning": [False], "data_without_type_warning": [False]}
@@ -289,10 +2162,21 @@ def main():
         # if num_of_saving_files == 0 then do not check the path and do not try to clear it
         if num_of_saving_files > 0:
             path_to_save_files = path_save_files_arg(parsed_args)
-            clear_path_arg(parsed_args, path_to_save_files)
 
         data_schema = data_schema_arg(parsed_args)
+        compiled_schema = compile_data_schema(data_schema, faker_options_arg(parsed_args), seed_arg(parsed_args))
+        faker_pools.prepare_pools(compiled_schema)
         num_of_processes = multiprocessing_arg(parsed_args)
+        options = OutputOptions(engine=engine_arg(parsed_args), batch_size=batch_size_arg(parsed_args),
+                                serializer=parsed_args.__dict__["serializer"],
+                                chunk_lines=chunk_lines_arg(parsed_args),
+                                compression=parsed_args.__dict__["compression"],
+                                compression_level=compression_level_arg(parsed_args),
+                                file_format=format_arg(parsed_args, num_of_saving_files),
+                                seed=seed_arg(parsed_args), profile=profile_arg(parsed_args, num_of_saving_files),
+                                write_queue=write_queue_arg(parsed_args), write_buffer=write_buffer_arg(parsed_args),
+                                fsync=parsed_args.__dict__["fsync"],
+                                stats=stats_arg(parsed_args, num_of_saving_files))
 
         file_name = parsed_args.__dict__["file_name"]
         if "/" in file_name:
@@ -304,15 +2188,68 @@ def main():
         if data_lines < 1:
             raise exc.ValueNegative("Data lines value")
 
+        limits = rolling_limits_arg(parsed_args, num_of_saving_files, options)
+
+        if num_of_processes == "auto" and limits is not None:
+            # the number of lines is only known from the size of the lines created so far
+            line_bytes = max(1, len(create_data_block((0, 100), probe_schema(compiled_schema), options)) // 100)
+            num_of_processes = auto_processes(compiled_schema, options, limits.target_bytes // line_bytes,
+                                              limits.target_bytes // line_bytes)
+        elif num_of_processes == "auto":
+            num_of_processes = auto_processes(compiled_schema, options, data_lines * max(num_of_saving_files, 1),
+                                              max_work_units(num_of_saving_files, data_lines, options))
+
+        counters = metrics.create_counters(num_of_processes)
+        progress_interval = parsed_args.__dict__["progress_interval"]
+
         if num_of_saving_files == 0:
             logging.info("Creating the data and printing it out...")
-            for _ in range(data_lines):
-                print(create_data_line(data_schema))
+            stream_to_stdout(compiled_schema, data_lines, num_of_processes, options,
+                             not parsed_args.__dict__["unordered"], counters, progress_interval)
             logging.info("Printing out data completed")
+        elif limits is not None:
+            shard_dirs = shard_dirs_arg(parsed_args)
+            clear_path_arg(parsed_args, path_to_save_files, [])
+            create_shard_dirs(path_to_save_files, shard_dirs)
+            logging.info("Creating data and putting it to the files is starting... ")
+            created_files = create_rolling_files(path_to_save_files, compiled_schema,
+                                                 file_naming(file_name, suffix, output_extension(options),
+                                                             options.seed, shard_dirs),
+                                                 limits, num_of_processes, options, counters, progress_interval)
+            if options.profile is not None:
+                profile.write_report(path_to_save_files, options.profile)
+            if options.stats:
+                stats.write_run_stats(path_to_save_files, [this_file_name for this_file_name, _ in created_files])
+            logging.info(f"Creating {len(created_files)} files and filling them with data finished")
         else:
-            files_to_create = create_file_names(num_of_saving_files, file_name, suffix)
+            shard_dirs = shard_dirs_arg(parsed_args)
+            settings = manifests.run_settings(data_schema, data_lines, options)
+            clearing = None
+            unique_values_arg(compiled_schema, num_of_saving_files, data_lines)
+            if resume_arg(parsed_args):
+                if has_unique_columns(compiled_schema) and options.seed is None:
+                    # random keys of the permutations would be different than the ones of the resumed run
+                    raise exc.IncompatibleOptions("--resume with unique columns", "a run without --seed")
+                # the names are taken from the manifest, because random suffixes would be different this time
+                files_to_create, done, manifest = manifests.resume_manifest(path_to_save_files, settings)
+            else:
+                files_to_create = create_file_names(num_of_saving_files, file_name, suffix,
+                                                    output_extension(options), options.seed, shard_dirs)
+                done = frozenset()
+                clearing = clear_path_arg(parsed_args, path_to_save_files, files_to_create)
+                manifest = manifests.start_manifest(path_to_save_files, settings, files_to_create)
+            create_shard_dirs(path_to_save_files, shard_dirs)
             logging.info("Creating data and putting it to the files is starting... ")
-            create_files(files_to_create, path_to_save_files, data_schema, data_lines, num_of_processes)
+            with manifest:
+                create_files(files_to_create, path_to_save_files, compiled_schema, data_lines, num_of_processes,
+                             options, counters, progress_interval, manifest, done)
+            manifests.finish_manifest(path_to_save_files)
+            if options.profile is not None:
+                profile.write_report(path_to_save_files, options.profile)
+            if options.stats:
+                stats.write_run_stats(path_to_save_files, files_to_create)
+            if clearing is not None:
+                clear.log_removed(*clearing.result())
 
             warnings = check_warnings(data_schema, warnings)
             if warnings["timestamp_with_value_warning"][0]:
@@ -323,6 +2260,10 @@ def main():
                                 f"because the types for their values weren't given!")
 
             logging.info("Creating files and filling them with data finished")
+
+        metrics.log_progress(counters, "Finished")
+        if parsed_args.__dict__["metrics_out"] is not None:
+            metrics.write_metrics(parsed_args.__dict__["metrics_out"], counters)
     except argparse.ArgumentError as arg_err:
         logging.error(arg_err.message.capitalize())
         exit(1)
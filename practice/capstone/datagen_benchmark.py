@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+
+import datagen
+import datagen_exceptions as exc
+
+# one column of every kind the schema can have, the wide schema repeats all of them
+COLUMN_KINDS = {"timestamp": "timestamp:", "int_rand": "int:rand(0, 1000000)", "str_rand": "str:rand",
+                "str_choice": "str:['red', 'green', 'blue', 'black']", "int_choice": "int:[1, 2, 3, 5, 8, 13]",
+                "const": "str:constant value"}
+WIDE_COLUMNS = 60
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_MAX_DROP = 20.0
+DEFAULT_LINES = 50000
+DEFAULT_REPEAT = 3
+
+
+def parsing():
+    parser = argparse.ArgumentParser(prog="datagen_benchmark",
+                                     description="Measures the speed of creating the data for every kind of column, "
+                                                 "a wide schema and 1..N processes, and compares it with the saved "
+                                                 "baseline. Nothing but the local disk is used.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, type=str,
+                        help=f"Json file with the baseline results. Default value = \"{DEFAULT_BASELINE}\"")
+    parser.add_argument("--save", action="store_true",
+                        help="Saves the results as the new baseline instead of comparing them with it.")
+    parser.add_argument("--max_drop", default=DEFAULT_MAX_DROP, type=float,
+                        help=f"Percent of the baseline rows/sec a benchmark can lose before the run fails. "
+                             f"Default value = {DEFAULT_MAX_DROP}")
+    parser.add_argument("--lines", default=DEFAULT_LINES, type=int,
+                        help=f"Number of lines created by a single benchmark. Default value = {DEFAULT_LINES}")
+    parser.add_argument("--processes", default=multiprocessing.cpu_count(), type=int,
+                        help="The biggest number of processes to measure create_files with. "
+                             "Default value = number of CPUs")
+    parser.add_argument("--repeat", default=DEFAULT_REPEAT, type=int,
+                        help=f"Every benchmark is run this many times and the fastest run is kept. "
+                             f"Default value = {DEFAULT_REPEAT}")
+    parser.add_argument("--engine", default="python", type=str, choices=["python", "numpy"],
+                        help="Engine the files are created with. Default value = \"python\"")
+    return parser.parse_args()
+
+
+def benchmark_schemas():
+    schemas = {kind: {kind: value} for kind, value in COLUMN_KINDS.items()}
+    kinds = list(COLUMN_KINDS.items())
+    schemas["wide"] = {f"{kinds[i % len(kinds)][0]}_{i}": kinds[i % len(kinds)][1] for i in range(WIDE_COLUMNS)}
+    return schemas
+
+
+def measure_lines(compiled_schema, lines):
+    # create_data_line alone - the bytes are counted after the time is measured
+    generators = datagen.bind_generators(compiled_schema, datagen.python_rng(datagen.OutputOptions(), (0, 0)))
+    start = time.perf_counter()
+    data = [datagen.create_data_line(generators) for _ in range(lines)]
+    seconds = time.perf_counter() - start
+    return seconds, sum(len(json.dumps(line)) + 1 for line in data)
+
+
+def _directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def measure_file(compiled_schema, lines, options):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        datagen.create_file_with_data("data.jsonl", tmp_dir, compiled_schema, lines, options)
+        seconds = time.perf_counter() - start
+        return seconds, _directory_size(tmp_dir)
+
+
+def measure_files(compiled_schema, lines, processes, options):
+    # 'lines' for every process, in two files each - lines * processes in total, so the results show how well the
+    # work scales
+    files_to_create = datagen.create_file_names(2 * processes, "data", "count")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        datagen.create_files(files_to_create, tmp_dir, compiled_schema, lines // 2, processes, options)
+        seconds = time.perf_counter() - start
+        return seconds, _directory_size(tmp_dir)
+
+
+def result(rows, seconds, size):
+    return {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds,
+            "megabytes_per_second": size / 1e6 / seconds}
+
+
+def run_benchmarks(lines, max_processes, repeat, options):
+    # {name of the benchmark: result}, the fastest of 'repeat' runs of each of them
+    benchmarks = {}
+    for name, schema in benchmark_schemas().items():
+        compiled_schema = datagen.compile_data_schema(schema)
+        benchmarks[f"create_data_line/{name}"] = (
+            lines, lambda compiled_schema=compiled_schema: measure_lines(compiled_schema, lines))
+        benchmarks[f"create_file_with_data/{name}"] = (
+            lines, lambda compiled_schema=compiled_schema: measure_file(compiled_schema, lines, options))
+
+    compiled_schema = datagen.compile_data_schema(benchmark_schemas()["wide"])
+    for processes in range(1, max_processes + 1):
+        benchmarks[f"create_files/wide/{processes}_processes"] = (
+            lines // 2 * 2 * processes, lambda processes=processes: measure_files(compiled_schema, lines, processes,
+                                                                                  options))
+
+    results = {}
+    for name, (rows, measure) in benchmarks.items():
+        seconds, size = min(measure() for _ in range(repeat))
+        results[name] = result(rows, seconds, size)
+        logging.info(f"{name}: {results[name]['rows_per_second']:.0f} rows/s, "
+                     f"{results[name]['megabytes_per_second']:.1f} MB/s")
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": multiprocessing.cpu_count(), "numpy": getattr(datagen.np, "__version__", None)}
+
+
+def compare(results, baseline, max_drop):
+    # names of the benchmarks slower than the baseline by more than max_drop percent
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        drop = 100 * (1 - current["rows_per_second"] / baseline[name]["rows_per_second"])
+        if drop > max_drop:
+            regressions.append(f"{name} ({drop:.1f}% slower)")
+    return regressions
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        args = parsing()
+        if args.lines < 1 or args.repeat < 1 or args.processes < 1:
+            raise exc.ValueNegative("Number of lines, repeats and processes")
+
+        options = datagen.OutputOptions(engine=args.engine)
+        results = run_benchmarks(args.lines, args.processes, args.repeat, options)
+
+        if args.save or not os.path.exists(args.baseline):
+            with open(args.baseline, "w") as baseline_file:
+                json.dump({"environment": environment(), "lines": args.lines, "options": options._asdict(),
+                           "results": results}, baseline_file, indent=2)
+            logging.info(f"Baseline saved to {args.baseline}")
+            return
+
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["environment"] != environment():
+            logging.warning(f"Baseline was measured in a different environment: {baseline['environment']}")
+        regressions = compare(results, baseline["results"], args.max_drop)
+        if regressions:
+            raise exc.ThroughputRegression(regressions, args.max_drop)
+        logging.info(f"No benchmark is slower than the baseline by more than {args.max_drop}%")
+    except exc.DatagenBaseException:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
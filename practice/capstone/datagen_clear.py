@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from datagen_stats import STATS_SUFFIX
+
+# number of files removed by a single task of the thread pool
+REMOVE_BATCH = 1000
+
+
+def is_output_file(entry_name, file_name, extensions):
+    # unmerged chunks are hidden files named ".<file name>.part<index>", unfinished files ".<file name>.tmp" - any of
+    # them can have its statistics in "<name>.stats.json"
+    if entry_name.endswith(STATS_SUFFIX):
+        entry_name = entry_name[:-len(STATS_SUFFIX)]
+    if entry_name.startswith(".") and entry_name.endswith(".tmp"):
+        entry_name = entry_name[1:-4]
+    elif entry_name.startswith("."):
+        entry_name, _, chunk_index = entry_name[1:].rpartition(".part")
+        if not chunk_index.isdigit():
+            return False
+    return entry_name.startswith(file_name) and entry_name.endswith(extensions)
+
+
+def find_output_files(path, file_name, extensions, shard_dirs=True):
+    # os.scandir gives the type of every entry without an additional stat call for each of them
+    found = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                if is_output_file(entry.name, file_name, extensions):
+                    found.append(entry.path)
+            # files from the runs with --shard_dirs are in the subdirectories named with numbers only
+            elif shard_dirs and entry.name.isdigit() and entry.is_dir(follow_symlinks=False):
+                found.extend(find_output_files(entry.path, file_name, extensions, False))
+    return found
+
+
+def _remove_batch(paths):
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def remove_files(paths, threads):
+    # unlinking is mostly waiting for the file system, so threads are enough to do it in parallel
+    start = time.perf_counter()
+    batches = [paths[i:i + REMOVE_BATCH] for i in range(0, len(paths), REMOVE_BATCH)]
+    with ThreadPoolExecutor(max(1, min(threads, len(batches)))) as executor:
+        removed = sum(executor.map(_remove_batch, batches))
+    return removed, time.perf_counter() - start
+
+
+def log_removed(removed, seconds):
+    logging.info(f"Deleted {removed} files in {seconds:.2f}s ({removed / max(seconds, 1e-9):.0f} files/s)")
+
+
+def clear_path(path, file_name, extensions, threads):
+    removed, seconds = remove_files(find_output_files(path, file_name, extensions), threads)
+    log_removed(removed, seconds)
+    return removed
+
+
+def split_removal(path, file_name, extensions, files_to_create):
+    # files that are going to be created again (with their statistics) and all unmerged chunks have to be removed
+    # right away, so that they can't be mistaken for new files - the rest can be removed while the new files are being
+    # created
+    files_to_create = {os.path.join(path, this_file_name) + suffix for this_file_name in files_to_create
+                       for suffix in ["", STATS_SUFFIX]}
+    now, later = [], []
+    for file_path in find_output_files(path, file_name, extensions):
+        if file_path in files_to_create or os.path.basename(file_path).startswith("."):
+            now.append(file_path)
+        else:
+            later.append(file_path)
+    return now, later
+
+
+def clear_path_in_background(path, file_name, extensions, threads, files_to_create):
+    now, later = split_removal(path, file_name, extensions, files_to_create)
+    log_removed(*remove_files(now, threads))
+    logging.info(f"Deleting {len(later)} more files in the background")
+
+    # the background thread doesn't log anything itself - the result (removed files, seconds) is reported by the
+    # caller, so that no logging lock is held while worker processes are being forked
+    executor = ThreadPoolExecutor(1)
+    future = executor.submit(remove_files, later, threads)
+    executor.shutdown(wait=False)
+    return future
@@ -54,3 +54,49 @@ class IncorrectValue(DatagenBaseException):
 class ForbiddenCharInFileName(DatagenBaseException):
     def __init__(self):
         logging.error("'/' character is forbidden in file names in linux systems")
+
+
+class MissingDependency(DatagenBaseException):
+    def __init__(self, package, option):
+        logging.error(f"Package '{package}' has to be installed to use {option}")
+
+
+class ValueOutOfRange(DatagenBaseException):
+    def __init__(self, value, low, high):
+        logging.error(f"{value} has to be between {low} and {high}")
+
+
+class IncompatibleOptions(DatagenBaseException):
+    def __init__(self, option, other_option):
+        logging.error(f"{option} can't be used together with {other_option}")
+
+
+class ThroughputRegression(DatagenBaseException):
+    def __init__(self, benchmarks, max_drop):
+        logging.error(f"Throughput dropped by more than {max_drop}% in: {', '.join(benchmarks)}")
+
+
+class MissingManifest(DatagenBaseException):
+    def __init__(self, path):
+        logging.error(f"There is no manifest of a previous run to resume: {path}")
+
+
+class ManifestMismatch(DatagenBaseException):
+    def __init__(self, settings):
+        logging.error(f"Run can't be resumed with different settings than the saved ones: {', '.join(settings)}")
+
+
+class UniqueValuesExhausted(DatagenBaseException):
+    def __init__(self, low, size):
+        logging.error(f"All {size} unique values of the range starting at {low} were used - the range is too small "
+                      f"for the number of lines")
+
+
+class NoFilesToVerify(DatagenBaseException):
+    def __init__(self, paths):
+        logging.error(f"There are no .jsonl files to verify in: {', '.join(paths)}")
+
+
+class VerificationFailed(DatagenBaseException):
+    def __init__(self, violations, lines):
+        logging.error(f"{violations} of {lines} lines don't match the data schema")
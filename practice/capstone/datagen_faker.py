@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+from collections import namedtuple
+
+import datagen_exceptions as exc
+
+try:
+    from faker import Faker
+except ImportError:
+    Faker = None
+
+# calling a Faker provider takes about 100-200 microseconds, so the values are created once into a pool and every row
+# takes a random one of them - a pool of N values gives at most N different values in the whole output (and repeats
+# them sooner the smaller it is), but costs N provider calls at the start of every process and N values of memory
+FakerOptions = namedtuple("FakerOptions", ["locale", "pool_size", "seed", "cache_dir"],
+                          defaults=["en_US", 10000, None, None])
+
+# a single "faker:<provider>" column - everything its pool of values depends on
+FakerColumn = namedtuple("FakerColumn", ["provider", "locale", "pool_size", "seed", "cache_dir"])
+
+# pools already created by the current process, and the same values encoded as json
+_pools = {}
+_encoded_pools = {}
+
+
+def faker_column(key, provider, options):
+    if Faker is None:
+        raise exc.MissingDependency("Faker", f"'faker:' type of '{key}'")
+    try:
+        fake = Faker(options.locale)
+    except AttributeError:
+        raise exc.IncorrectValue(options.locale, "Faker locale")
+    # only the methods of the providers - the ones of Faker itself (seed, add_provider, format...) don't give values
+    if not provider.isidentifier() or provider.startswith("_") or not any(
+            callable(getattr(faker_provider, provider, None)) for faker_provider in fake.factories[0].providers):
+        raise exc.IncorrectValue(provider, "name of a Faker provider")
+    try:
+        # the pools call the provider without arguments, so the ones that need them are refused here
+        getattr(fake, provider)()
+    except TypeError:
+        raise exc.IncorrectValue(provider, "name of a Faker provider")
+    return FakerColumn(provider, *options)
+
+
+def pool_path(column):
+    seed = "random" if column.seed is None else column.seed
+    return os.path.join(column.cache_dir, f"{column.provider}-{column.locale}-{seed}-{column.pool_size}.json")
+
+
+def create_pool(column):
+    fake = Faker(column.locale)
+    if column.seed is not None:
+        fake.seed_instance(f"{column.seed}:{column.provider}")
+    provider = getattr(fake, column.provider)
+    # values which can't be written as json (dates, decimals, bytes...) are kept as their text
+    return [value if isinstance(value, (str, int, float, bool)) else str(value)
+            for value in (provider() for _ in range(column.pool_size))]
+
+
+def load_pool(column):
+    if column.cache_dir is None:
+        return create_pool(column)
+
+    path = pool_path(column)
+    if os.path.exists(path):
+        with open(path) as pool_file:
+            return json.load(pool_file)
+
+    pool = create_pool(column)
+    os.makedirs(column.cache_dir, exist_ok=True)
+    # written under a temporary name first, so that other processes never read a half written pool
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as pool_file:
+        json.dump(pool, pool_file)
+    os.replace(temporary_path, path)
+    logging.info(f"Pool of {column.pool_size} '{column.provider}' values saved to {path}")
+    return pool
+
+
+def value_pool(column):
+    # created once per process and shared by all of its files and chunks
+    if column not in _pools:
+        _pools[column] = load_pool(column)
+    return _pools[column]
+
+
+def encoded_pool(column):
+    if column not in _encoded_pools:
+        _encoded_pools[column] = [json.dumps(value) for value in value_pool(column)]
+    return _encoded_pools[column]
+
+
+def prepare_pools(compiled_schema):
+    # called before the workers are started, so that forked processes get the pools without creating them again
+    for column in compiled_schema:
+        if column.kind == "faker":
+            value_pool(column.value)
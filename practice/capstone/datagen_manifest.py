@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+
+import datagen_exceptions as exc
+
+# json lines file in the directory of the output files - the first line describes the run, every next one is a file
+# committed by it, so recording a file is a single append instead of saving the whole manifest again; it's kept only
+# until the run is finished, so it's left behind only by the runs which can be resumed
+MANIFEST_NAME = ".datagen_manifest.jsonl"
+
+# options changing the data in the files - a run can only be resumed with the same ones
+OUTPUT_OPTIONS = ["engine", "batch_size", "serializer", "chunk_lines", "compression", "compression_level",
+                  "file_format", "seed", "stats"]
+
+
+def manifest_path(path_to_save_files):
+    return os.path.join(path_to_save_files, MANIFEST_NAME)
+
+
+def run_settings(data_schema, data_lines, options):
+    return {"data_schema": data_schema, "data_lines": data_lines,
+            "options": {option: getattr(options, option) for option in OUTPUT_OPTIONS}}
+
+
+def start_manifest(path_to_save_files, settings, files_to_create):
+    manifest = open(manifest_path(path_to_save_files), "w")
+    manifest.write(json.dumps({"run": settings, "files": files_to_create}) + "\n")
+    manifest.flush()
+    return manifest
+
+
+def read_manifest(path_to_save_files):
+    # (settings of the run, names of all its files, {name of a committed file: number of its lines})
+    path = manifest_path(path_to_save_files)
+    if not os.path.isfile(path):
+        raise exc.MissingManifest(path)
+
+    committed = {}
+    with open(path) as manifest:
+        header = json.loads(manifest.readline())
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except json.decoder.JSONDecodeError:
+                # the last line can be cut off if the run was killed while writing it
+                continue
+            committed[record["file"]] = record["lines"]
+    return header["run"], header["files"], committed
+
+
+def resume_manifest(path_to_save_files, settings):
+    # names of all files of the run and the ones that still have to be created, and the manifest opened to record them
+    saved_settings, files_to_create, committed = read_manifest(path_to_save_files)
+    different = sorted(key for key in settings if settings[key] != saved_settings.get(key))
+    if different:
+        raise exc.ManifestMismatch(different)
+
+    done = {this_file_name for this_file_name, lines in committed.items()
+            if lines == settings["data_lines"] and os.path.isfile(os.path.join(path_to_save_files, this_file_name))}
+    for directory in {os.path.dirname(this_file_name) for this_file_name in files_to_create} - {""}:
+        os.makedirs(os.path.join(path_to_save_files, directory), exist_ok=True)
+    logging.info(f"Resuming the run - {len(done)} of {len(files_to_create)} files were already created")
+    return files_to_create, done, open(manifest_path(path_to_save_files), "a")
+
+
+def record_file(manifest, this_file_name, lines):
+    # called only once the file has got its final name
+    if manifest is not None:
+        manifest.write(json.dumps({"file": this_file_name, "lines": lines}) + "\n")
+        manifest.flush()
+
+
+def finish_manifest(path_to_save_files):
+    os.remove(manifest_path(path_to_save_files))
@@ -0,0 +1,106 @@
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+
+# counters kept for every process - bytes are counted before compression, jsonl lines are formatted while their values
+# are created, so for jsonl the serializing time is only the encoding of the text and the rest is in generate_seconds
+FIELDS = ["rows", "bytes", "files", "generate_seconds", "serialize_seconds", "write_seconds"]
+ROWS, BYTES, FILES, GENERATE, SERIALIZE, WRITE = range(len(FIELDS))
+
+# counters of the current process - its own part of the shared array, so it's updated without any lock
+_current = {"values": [0.0] * len(FIELDS), "offset": 0}
+
+
+def create_counters(workers):
+    # slot 0 belongs to the main process, the next ones are taken by the workers when they start
+    return {"values": multiprocessing.Array("d", len(FIELDS) * (workers + 1), lock=False),
+            "next_slot": multiprocessing.Value("i", 1), "workers": workers, "start": time.time()}
+
+
+def attach(counters, main=False):
+    slot = 0
+    if not main:
+        with counters["next_slot"].get_lock():
+            slot = counters["next_slot"].value
+            counters["next_slot"].value += 1
+        # a worker replacing a dead one shares a slot with another worker instead of going out of the array
+        slot = 1 + (slot - 1) % counters["workers"]
+    _current["values"] = counters["values"]
+    _current["offset"] = slot * len(FIELDS)
+
+
+def add(field, value):
+    _current["values"][_current["offset"] + field] += value
+
+
+def add_batch(rows, size, write_seconds):
+    # called once per batch of lines, not for every line, so the counters cost next to nothing
+    values, offset = _current["values"], _current["offset"]
+    values[offset + ROWS] += rows
+    values[offset + BYTES] += size
+    values[offset + WRITE] += write_seconds
+
+
+def slots(counters):
+    # all the counters are kept as doubles, the counted ones are given back as integers
+    values = counters["values"][:]
+    return [{field: int(value) if index < GENERATE else value
+             for index, (field, value) in enumerate(zip(FIELDS, values[i:i + len(FIELDS)]))}
+            for i in range(0, len(values), len(FIELDS))]
+
+
+def totals(counters):
+    return {field: sum(slot[field] for slot in slots(counters)) for field in FIELDS}
+
+
+def _speed(total, elapsed):
+    return {"elapsed_seconds": elapsed, "rows_per_second": total["rows"] / max(elapsed, 1e-9),
+            "megabytes_per_second": total["bytes"] / 1e6 / max(elapsed, 1e-9)}
+
+
+def log_progress(counters, message="Progress"):
+    total = totals(counters)
+    speed = _speed(total, time.time() - counters["start"])
+    logging.info(f"{message}: {int(total['rows'])} lines, {total['bytes'] / 1e6:.1f} MB, {int(total['files'])} files "
+                 f"in {speed['elapsed_seconds']:.1f}s - {speed['rows_per_second']:.0f} lines/s, "
+                 f"{speed['megabytes_per_second']:.1f} MB/s")
+
+
+@contextmanager
+def progress(counters, interval):
+    # logs the progress every interval seconds from a thread of the main process, while the work is being done
+    if interval <= 0:
+        yield
+        return
+
+    stop = threading.Event()
+
+    def report():
+        while not stop.wait(interval):
+            log_progress(counters)
+
+    thread = threading.Thread(target=report, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def summary(counters):
+    total = totals(counters)
+    result = dict(total, **_speed(total, time.time() - counters["start"]))
+    result["processes"] = counters["workers"]
+    result["main_process"] = slots(counters)[0]
+    result["workers"] = slots(counters)[1:]
+    return result
+
+
+def write_metrics(path, counters):
+    with open(path, "w") as metrics_file:
+        json.dump(summary(counters), metrics_file, indent=2)
+    logging.info(f"Metrics saved to {path}")
@@ -0,0 +1,114 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import shutil
+import tracemalloc
+
+# per-process stats are saved here, inside the directory of the output files, and removed once they are merged
+STATS_DIR = ".datagen_profile"
+CPU_REPORT = "datagen_profile_cpu"
+MEM_REPORT = "datagen_profile_mem.txt"
+REPORT_LINES = 40
+TRACEMALLOC_FRAMES = 10
+
+# profiler of the current process - nothing is done while the mode is None, so the hooks cost nothing by default
+_current = {"mode": None, "profiler": None, "snapshot": None, "peak": 0}
+
+
+def stats_path(path_to_save_files, mode):
+    return os.path.join(path_to_save_files, STATS_DIR, f"{mode}-{os.getpid()}")
+
+
+def start(mode, path_to_save_files):
+    _current.update(mode=mode, path=path_to_save_files, profiler=None, snapshot=None, peak=0)
+    if mode is None:
+        return
+    os.makedirs(os.path.join(path_to_save_files, STATS_DIR), exist_ok=True)
+    if mode == "cpu":
+        _current["profiler"] = cProfile.Profile()
+    elif not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def run(function, *args):
+    # the stats are saved after every unit of work, because the processes of a pool are terminated without running
+    # any exit handlers
+    mode = _current["mode"]
+    if mode is None:
+        return function(*args)
+
+    if mode == "cpu":
+        result = _current["profiler"].runcall(function, *args)
+        _current["profiler"].dump_stats(stats_path(_current["path"], mode))
+    else:
+        result = function(*args)
+        if _current["snapshot"] is not None:
+            _current["snapshot"].dump(stats_path(_current["path"], mode))
+    return result
+
+
+def checkpoint():
+    # called by the writers once a batch of lines is ready, while it's still in the memory - the snapshot taken at the
+    # biggest amount of traced memory is the one kept for the report
+    if _current["mode"] != "mem":
+        return
+    traced = tracemalloc.get_traced_memory()[0]
+    if traced > _current["peak"]:
+        _current["peak"] = traced
+        _current["snapshot"] = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def _stats_files(path_to_save_files, mode):
+    stats_dir = os.path.join(path_to_save_files, STATS_DIR)
+    if not os.path.isdir(stats_dir):
+        return []
+    return sorted(os.path.join(stats_dir, name) for name in os.listdir(stats_dir) if name.startswith(mode + "-"))
+
+
+def write_cpu_report(path_to_save_files, files):
+    stats = pstats.Stats(*files)
+    stats.dump_stats(os.path.join(path_to_save_files, CPU_REPORT + ".prof"))
+    report = io.StringIO()
+    stats.stream = report
+    stats.sort_stats("tottime").print_stats(REPORT_LINES)
+    stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+    with open(os.path.join(path_to_save_files, CPU_REPORT + ".txt"), "w") as report_file:
+        report_file.write(report.getvalue())
+
+
+def write_mem_report(path_to_save_files, files):
+    # statistics of every process are added up by the line of code that allocated the memory
+    allocations = {}
+    for file in files:
+        for statistic in tracemalloc.Snapshot.load(file).statistics("lineno"):
+            size, count = allocations.get(statistic.traceback, (0, 0))
+            allocations[statistic.traceback] = (size + statistic.size, count + statistic.count)
+
+    top = sorted(allocations.items(), key=lambda allocation: allocation[1][0], reverse=True)
+    with open(os.path.join(path_to_save_files, MEM_REPORT), "w") as report_file:
+        report_file.write(f"Top allocations at the peak of traced memory of {len(files)} processes\n")
+        for traceback, (size, count) in top[:REPORT_LINES]:
+            frame = traceback[0]
+            report_file.write(f"{size / 1024:12.1f} KiB {count:10} blocks  {frame.filename}:{frame.lineno}\n")
+
+
+def write_report(path_to_save_files, mode):
+    files = _stats_files(path_to_save_files, mode)
+    if files:
+        if mode == "cpu":
+            write_cpu_report(path_to_save_files, files)
+            logging.info(f"CPU profile of {len(files)} processes saved to "
+                         f"{os.path.join(path_to_save_files, CPU_REPORT)}.txt/.prof")
+        else:
+            write_mem_report(path_to_save_files, files)
+            logging.info(f"Memory profile of {len(files)} processes saved to "
+                         f"{os.path.join(path_to_save_files, MEM_REPORT)}")
+    shutil.rmtree(os.path.join(path_to_save_files, STATS_DIR), ignore_errors=True)
+
+    # the main process may have profiled the work itself
+    _current.update(mode=None, profiler=None, snapshot=None)
+    if mode == "mem" and tracemalloc.is_tracing():
+        tracemalloc.stop()
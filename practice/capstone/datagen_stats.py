@@ -0,0 +1,192 @@
+import json
+import logging
+import math
+import os
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# statistics of a file are saved next to it as "<file name>.stats.json", the merged ones of the whole run in RUN_STATS
+STATS_SUFFIX = ".stats.json"
+RUN_STATS = "datagen_stats.json"
+
+# kinds of columns with numbers only, and the ones with a few repeated values - their values are counted, which gives
+# the moments too, the rest only get the number of values and nulls
+NUMERIC_KINDS = ("timestamp", "time_range", "randint", "sequence", "unique_int")
+CATEGORY_KINDS = ("choice", "weighted", "faker", "const")
+
+# the most values kept by the counters of a column - the counts of values are exact as long as a column has at most
+# this many different ones, above it the counts (Misra-Gries) are lower by at most "top_error"
+TOP_VALUES = 50
+
+
+def stats_path(file_path):
+    return file_path + STATS_SUFFIX
+
+
+def _empty_column(kind):
+    return {"kind": kind, "count": 0, "nulls": 0, "numbers": 0, "mean": 0.0, "m2": 0.0, "min": None, "max": None,
+            "top": {} if kind in CATEGORY_KINDS else None, "top_error": 0}
+
+
+def create_stats(compiled_schema):
+    return {"rows": 0, "columns": {column.key: _empty_column(column.kind) for column in compiled_schema}}
+
+
+def _merge_moments(summary, numbers, mean, m2, low, high):
+    # the parallel version of Welford's algorithm, so batches, chunks and files can be added in any order
+    if not numbers:
+        return
+    total = summary["numbers"] + numbers
+    delta = mean - summary["mean"]
+    summary["m2"] += m2 + delta * delta * summary["numbers"] * numbers / total
+    summary["mean"] += delta * numbers / total
+    summary["min"] = low if summary["min"] is None else min(summary["min"], low)
+    summary["max"] = high if summary["max"] is None else max(summary["max"], high)
+    summary["numbers"] = total
+
+
+def _merge_top(summary, counts, error):
+    top = summary["top"]
+    for value, value_count in counts.items():
+        top[value] = top.get(value, 0) + value_count
+    summary["top_error"] += error
+    if len(top) > TOP_VALUES:
+        # every count is lowered by the first count that doesn't fit, which keeps the summaries mergeable
+        cut = sorted(top.values(), reverse=True)[TOP_VALUES]
+        summary["top"] = {value: value_count - cut for value, value_count in top.items() if value_count > cut}
+        summary["top_error"] += cut
+
+
+def _numeric_moments(values):
+    # (number of numbers, mean, sum of squared differences from the mean, min, max)
+    if np is not None and isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+        if not len(values):
+            return 0, 0.0, 0.0, None, None
+        array = values.astype(np.float64)
+        mean = float(array.mean())
+        return len(values), mean, float(((array - mean) ** 2).sum()), values.min().item(), values.max().item()
+
+    numbers = [value for value in values if type(value) is int or type(value) is float]
+    if not numbers:
+        return 0, 0.0, 0.0, None, None
+    mean = math.fsum(numbers) / len(numbers)
+    return len(numbers), mean, math.fsum((value - mean) ** 2 for value in numbers), min(numbers), max(numbers)
+
+
+def _counted_moments(counts):
+    numbers = [(value, value_count) for value, value_count in counts.items()
+               if type(value) is int or type(value) is float]
+    total = sum(value_count for _, value_count in numbers)
+    if not total:
+        return 0, 0.0, 0.0, None, None
+    mean = math.fsum(value * value_count for value, value_count in numbers) / total
+    return (total, mean, math.fsum(value_count * (value - mean) ** 2 for value, value_count in numbers),
+            min(value for value, _ in numbers), max(value for value, _ in numbers))
+
+
+def update_column(summary, values):
+    if np is not None and isinstance(values, np.ndarray) and values.dtype.kind not in "iuf":
+        values = values.tolist()
+    summary["count"] += len(values)
+
+    if summary["kind"] in CATEGORY_KINDS:
+        try:
+            counts = Counter(values)
+        except TypeError:
+            # lists and dicts from the choices can't be counted as they are
+            counts = Counter(map(json.dumps, values))
+            summary["nulls"] += counts.get("null", 0)
+            _merge_top(summary, counts, 0)
+            return
+        summary["nulls"] += counts.get(None, 0)
+        _merge_moments(summary, *_counted_moments(counts))
+        # values are kept as json, so that they stay the same after reading them back from the file
+        _merge_top(summary, {json.dumps(value): value_count for value, value_count in counts.items()}, 0)
+
+    elif summary["kind"] in NUMERIC_KINDS:
+        _merge_moments(summary, *_numeric_moments(values))
+
+    elif isinstance(values, list):
+        summary["nulls"] += values.count(None)
+
+
+def update(stats, compiled_schema, columns):
+    # called with every batch of columns, before they are written
+    stats["rows"] += len(columns[0]) if columns else 0
+    for column, values in zip(compiled_schema, columns):
+        update_column(stats["columns"][column.key], values)
+
+
+def observer(stats, compiled_schema):
+    return lambda columns: update(stats, compiled_schema, columns)
+
+
+def merge(stats, other):
+    stats["rows"] += other["rows"]
+    for key, other_summary in other["columns"].items():
+        summary = stats["columns"].setdefault(key, _empty_column(other_summary["kind"]))
+        summary["count"] += other_summary["count"]
+        summary["nulls"] += other_summary["nulls"]
+        _merge_moments(summary, other_summary["numbers"], other_summary["mean"], other_summary["m2"],
+                       other_summary["min"], other_summary["max"])
+        if summary["top"] is not None:
+            _merge_top(summary, other_summary["top"], other_summary["top_error"])
+    return stats
+
+
+def _column_report(summary):
+    report = dict(summary)
+    report["std"] = math.sqrt(summary["m2"] / summary["numbers"]) if summary["numbers"] else None
+    if not summary["numbers"]:
+        report["mean"] = None
+    if summary["top"] is not None:
+        report["top"] = [[json.loads(value), value_count] for value, value_count in
+                         sorted(summary["top"].items(), key=lambda item: item[1], reverse=True)]
+    return report
+
+
+def _column_summary(report):
+    summary = {key: report[key] for key in _empty_column(report["kind"])}
+    summary["mean"] = summary["mean"] or 0.0
+    if summary["top"] is not None:
+        summary["top"] = {json.dumps(value): value_count for value, value_count in summary["top"]}
+    return summary
+
+
+def write_stats(file_path, stats, extra=None):
+    report = {**(extra or {}), "rows": stats["rows"],
+              "columns": {key: _column_report(summary) for key, summary in stats["columns"].items()}}
+    with open(file_path, "w") as stats_file:
+        json.dump(report, stats_file, indent=2)
+
+
+def read_stats(file_path):
+    with open(file_path) as stats_file:
+        report = json.load(stats_file)
+    return {"rows": report["rows"],
+            "columns": {key: _column_summary(column) for key, column in report["columns"].items()}}
+
+
+def commit_stats(temporary_path, file_path):
+    # the statistics get their final name before the file does, so every finished file has them
+    os.replace(stats_path(temporary_path), stats_path(file_path))
+
+
+def merge_files(stats_paths):
+    stats = {"rows": 0, "columns": {}}
+    for path in stats_paths:
+        merge(stats, read_stats(path))
+    return stats
+
+
+def write_run_stats(path_to_save_files, file_names):
+    # summary of the run merged from the statistics of its files - only the small sidecars are read, files that
+    # weren't created (because they already existed) have none
+    paths = [path for path in (stats_path(os.path.join(path_to_save_files, this_file_name))
+                               for this_file_name in file_names) if os.path.isfile(path)]
+    write_stats(os.path.join(path_to_save_files, RUN_STATS), merge_files(paths), {"files": len(paths)})
+    logging.info(f"Statistics of {len(paths)} files saved to {os.path.join(path_to_save_files, RUN_STATS)}")
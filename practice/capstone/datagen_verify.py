@@ -0,0 +1,172 @@
+import bz2
+import gzip
+import json
+import lzma
+import multiprocessing
+import os
+import re
+
+# compressed files can't be read from the middle, so each of them is checked as a whole by a single process
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# bytes read from a file at once - lines are taken out of the buffer without a system call for each of them
+READ_BUFFER = 4 * 2 ** 20
+
+# characters of a violating line kept in the report
+LINE_EXCERPT = 200
+
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}")
+UNIQUE_STR_PATTERN = re.compile(r"[0-9a-f]{16}")
+JSON_SCALARS = (str, int, float, bool, type(None))
+
+# validator of the current process, compiled once by init_worker
+_worker_state = {}
+
+
+def _member_check(choices):
+    if all(type(choice) in JSON_SCALARS for choice in choices):
+        # the type is a part of the key, so that 1, 1.0 and true are different values
+        allowed = {(type(choice), choice) for choice in choices}
+        return lambda value: type(value) in JSON_SCALARS and (type(value), value) in allowed
+    # lists and dicts are compared as json, tuples of the schema are lists in the files
+    allowed = {json.dumps(choice, sort_keys=True) for choice in choices}
+    return lambda value: json.dumps(value, sort_keys=True) in allowed
+
+
+def _sequence_check(start, step):
+    if step == 0:
+        return lambda value: type(value) is int and value == start
+    return lambda value: type(value) is int and (value - start) * step >= 0 and (value - start) % step == 0
+
+
+def column_check(column):
+    # function telling if a single value can be a value of the column - the schema is parsed only once, here
+    if column.kind in ("timestamp", "time_range"):
+        return lambda value: type(value) is float
+    elif column.kind == "randint":
+        low, high = column.value
+        return lambda value: type(value) is int and low <= value <= high
+    elif column.kind == "uuid":
+        return lambda value: type(value) is str and UUID_PATTERN.fullmatch(value) is not None
+    elif column.kind == "sequence":
+        return _sequence_check(*column.value)
+    elif column.kind == "unique_int":
+        low, high = column.value.low, column.value.low + column.value.size - 1
+        return lambda value: type(value) is int and low <= value <= high
+    elif column.kind == "unique_str":
+        return lambda value: type(value) is str and UNIQUE_STR_PATTERN.fullmatch(value) is not None
+    elif column.kind == "choice":
+        return _member_check(column.value)
+    elif column.kind == "weighted":
+        return _member_check(column.value.choices)
+    elif column.kind == "faker":
+        # the values depend on the pool of the run, only their type can be checked
+        return lambda value: type(value) in JSON_SCALARS and value is not None
+    return _member_check([column.value])
+
+
+def compile_validator(compiled_schema):
+    # function returning None for a correct line, or (key, description of the problem)
+    checks = [(column.key, column_check(column)) for column in compiled_schema]
+    keys = {column.key for column in compiled_schema}
+
+    def validate(line):
+        try:
+            row = json.loads(line)
+        except ValueError:
+            return None, "not a json line"
+        if type(row) is not dict:
+            return None, "not a json object"
+        if row.keys() != keys:
+            missing, extra = sorted(keys - row.keys()), sorted(row.keys() - keys)
+            return None, f"missing keys {missing}, unexpected keys {extra}"
+        for key, check in checks:
+            if not check(row[key]):
+                return key, f"unexpected value {json.dumps(row[key])}"
+        return None
+
+    return validate
+
+
+def is_data_file(entry_name):
+    # hidden files are unfinished files and chunks of a run
+    return not entry_name.startswith(".") and entry_name.endswith(tuple(".jsonl" + extension for extension in
+                                                                        ["", *OPENERS]))
+
+
+def find_files(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in sorted(os.walk(path)):
+                found.extend(os.path.join(directory, name) for name in sorted(file_names) if is_data_file(name))
+        elif os.path.isfile(path):
+            found.append(path)
+    return found
+
+
+def file_ranges(file_path, block_bytes):
+    # (path, first byte, end byte) of every part of the file checked by a single task - None for the whole file
+    if os.path.splitext(file_path)[1] in OPENERS:
+        return [(file_path, 0, None)]
+    size = os.path.getsize(file_path)
+    return [(file_path, start, min(start + block_bytes, size)) for start in range(0, max(size, 1), block_bytes)]
+
+
+def range_lines(opened_file, start, end):
+    # (offset, line) of every line starting in [start, end) - the line going over the start belongs to the range
+    # before, which reads it to the end
+    position = 0
+    if start > 0:
+        opened_file.seek(start - 1)
+        position = start - 1 + len(opened_file.readline())
+    for line in opened_file:
+        if end is not None and position >= end:
+            return
+        yield position, line
+        position += len(line)
+
+
+def open_plain(file_path, mode):
+    return open(file_path, mode, buffering=READ_BUFFER)
+
+
+def verify_range(file_range):
+    # (number of lines, number of violating lines, sample of the violations) of a single range of a file
+    file_path, start, end = file_range
+    validate, sample = _worker_state["validate"], _worker_state["sample"]
+    opener = OPENERS.get(os.path.splitext(file_path)[1], open_plain)
+
+    lines, violations, found = 0, 0, []
+    with opener(file_path, "rb") as opened_file:
+        for offset, line in range_lines(opened_file, start, end):
+            lines += 1
+            problem = validate(line)
+            if problem is not None:
+                violations += 1
+                if len(found) < sample:
+                    found.append({"file": file_path, "offset": offset, "key": problem[0], "problem": problem[1],
+                                  "line": line[:LINE_EXCERPT].decode(errors="replace").rstrip("\n")})
+    return lines, violations, found
+
+
+def init_worker(compiled_schema, sample):
+    _worker_state["validate"] = compile_validator(compiled_schema)
+    _worker_state["sample"] = sample
+
+
+def verify_files(file_paths, compiled_schema, num_of_processes=1, block_bytes=64 * 2 ** 20, sample=10):
+    # {"files", "lines", "violations", "sample"} - the sample has the first violations by the file and the offset
+    ranges = [file_range for file_path in file_paths for file_range in file_ranges(file_path, block_bytes)]
+    if num_of_processes == 1 or len(ranges) == 1:
+        init_worker(compiled_schema, sample)
+        results = list(map(verify_range, ranges))
+    else:
+        with multiprocessing.Pool(min(num_of_processes, len(ranges)), initializer=init_worker,
+                                  initargs=(compiled_schema, sample)) as pool:
+            results = list(pool.imap_unordered(verify_range, ranges))
+
+    found = sorted((violation for _, _, range_found in results for violation in range_found),
+                   key=lambda violation: (violation["file"], violation["offset"]))
+    return {"files": len(file_paths), "lines": sum(lines for lines, _, _ in results),
+            "violations": sum(violations for _, violations, _ in results), "sample": found[:sample]}
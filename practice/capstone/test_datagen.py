@@ -1,11 +1,21 @@
 import ast
+import bz2
+import csv
+import gzip
+import io
 import json
+import logging
+import lzma
 import re
 import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from uuid import UUID
 
 import pytest
 import datagen
+import datagen_benchmark
 import tempfile
 import os
 
@@ -13,7 +23,7 @@ import os
 def check_values_in_output_file(data_schema, output_dict):
     for key in data_schema:
         if ":" in data_schema[key]:
-            left, right = data_schema[key].split(":")
+            left, right = data_schema[key].split(":", 1)
             assert key in output_dict.keys()
             output_val = output_dict[key]
 
@@ -53,6 +63,9 @@ def check_values_in_output_file(data_schema, output_dict):
                 except SyntaxError:
                     pytest.fail(f"List of values for '{key}' is incorrect")
 
+            elif right[0] == "{" and right[-1] == "}":
+                assert output_val in ast.literal_eval(right)
+
             # float values possible too
             elif left != "str":
                 try:
@@ -70,6 +83,14 @@ def check_values_in_output_file(data_schema, output_dict):
             assert type(output_dict[key]) == float
 
 
+def check_distribution(values, weights, tolerance=0.02):
+    # share of every value in the output can differ from its weight by at most the tolerance
+    total_weight = sum(weights.values())
+    assert set(values) <= set(weights)
+    for value, weight in weights.items():
+        assert abs(values.count(value) / len(values) - weight / total_weight) <= tolerance, value
+
+
 @pytest.fixture()
 def dict_data_schema():
     data_schema_dict = {"str_rand": "str:rand", "int_rand": "int:rand", "str_list": "str:['a', 'b']",
@@ -204,3 +225,826 @@ def test_warnings(caplog, param_data_schema):
     elif re.search("no_type_warning", param_data_schema):
         assert "no_type_warning" in caplog.text
 
+
+def test_compiled_schema_values(dict_data_schema):
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    assert [column.key for column in compiled_schema] == list(dict_data_schema.keys())
+    generators = datagen.bind_generators(compiled_schema, datagen.random)
+    for _ in range(100):
+        check_values_in_output_file(dict_data_schema, datagen.create_data_line(generators))
+
+
+@pytest.mark.parametrize("param_data_schema, exception", [
+    ({"list": 5}, datagen.exc.IncorrectSchema),
+    ({"list": "str:[a, b]"}, datagen.exc.WrongListOfChoices),
+    ({"list": "int:[]"}, datagen.exc.WrongListOfChoices),
+    ({"range": "str:rand(1, 2)"}, datagen.exc.WrongTypeRandRange),
+    ({"range": "int:rand(a, 2)"}, datagen.exc.IncorrectValue),
+    ({"value": "int:1.5"}, datagen.exc.IncorrectValue),
+    ({"value": "bool:maybe"}, datagen.exc.IncorrectType),
+])
+def test_schema_errors_raised_at_compile_time(param_data_schema, exception):
+    with pytest.raises(exception):
+        datagen.compile_data_schema(param_data_schema)
+
+
+def test_numpy_engine(dict_data_schema):
+    pytest.importorskip("numpy")
+    tmp_dir = tempfile.TemporaryDirectory()
+    sys.argv = ['datagen', tmp_dir.name, '--data_schema=' + json.dumps(dict_data_schema), '--file_name=data',
+                '--files_count=2', '--data_lines=250', '--engine=numpy', '--batch_size=100']
+    datagen.main()
+
+    for file in os.listdir(tmp_dir.name):
+        with open(os.path.join(tmp_dir.name, file), 'r') as output_file:
+            lines = output_file.read().splitlines()
+        assert 250 == len(lines)
+        for line in lines:
+            output_dict = json.loads(line)
+            assert list(output_dict.keys()) == list(dict_data_schema.keys())
+            check_values_in_output_file(dict_data_schema, output_dict)
+
+
+def test_template_serializer_matches_json():
+    data_schema = {"str_list": "str:['a', 'quote\"', 'back\\\\slash', 'żółw', 'tab\\t', '{}']",
+                   "int_rand": "int:rand", "mixed_list": "int:[0, 1.5, None, True, 'x', [1, 2]]",
+                   "{key}": "str:{value}", "\"quoted\"": "int:", "float_val": "float:1.25",
+                   "int_rand_range": "int:rand(-99, 99)"}
+    compiled_schema = datagen.compile_data_schema(data_schema)
+
+    json_lines = datagen.json_lines_serializer(compiled_schema, datagen.random.Random(0))(500)
+    template_lines = datagen.template_lines_serializer(compiled_schema, datagen.random.Random(0))(500)
+    assert json_lines == template_lines
+
+
+def test_chunked_file_creation(dict_data_schema):
+    tmp_dir = tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=300, chunk_lines=1000)
+    datagen.create_files(["data1.jsonl", "data2.jsonl"], tmp_dir.name, compiled_schema, 2500, 2, options)
+    assert ["data1.jsonl", "data2.jsonl"] == sorted(os.listdir(tmp_dir.name))
+
+    for file in os.listdir(tmp_dir.name):
+        with open(os.path.join(tmp_dir.name, file), 'r') as output_file:
+            lines = output_file.read().splitlines()
+        assert 2500 == len(lines)
+        for line in lines:
+            check_values_in_output_file(dict_data_schema, json.loads(line))
+
+
+def test_merge_chunks_keeps_order():
+    tmp_dir = tempfile.TemporaryDirectory()
+    for chunk_index in range(5):
+        with open(os.path.join(tmp_dir.name, datagen.part_file_name("data.jsonl", chunk_index)), 'w') as part_file:
+            part_file.write(f"{chunk_index}\n" * (chunk_index + 1))
+
+    datagen.merge_chunks("data.jsonl", tmp_dir.name, 5)
+    assert ["data.jsonl"] == os.listdir(tmp_dir.name)
+    with open(os.path.join(tmp_dir.name, "data.jsonl"), 'r') as output_file:
+        assert "0\n1\n1\n2\n2\n2\n3\n3\n3\n3\n4\n4\n4\n4\n4\n" == output_file.read()
+
+
+@pytest.mark.parametrize("num_of_processes, ordered", [(1, True), (2, True), (2, False)])
+def test_streaming_to_stdout(capsysbinary, dict_data_schema, num_of_processes, ordered):
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=100)
+    datagen.stream_to_stdout(compiled_schema, 1050, num_of_processes, options, ordered)
+
+    lines = capsysbinary.readouterr().out.splitlines()
+    assert 1050 == len(lines)
+    for line in lines:
+        check_values_in_output_file(dict_data_schema, json.loads(line))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_stream_blocks_window(monkeypatch, ordered):
+    # ordered blocks are read from their own results - nothing else may keep them until the end of the run
+    monkeypatch.setattr(datagen, "create_worker_block", lambda block: block)
+    with ThreadPool(2) as pool:
+        apply_async, callbacks = pool.apply_async, []
+
+        def recording_apply_async(function, args, **kwargs):
+            callbacks.append("callback" in kwargs)
+            return apply_async(function, args, **kwargs)
+
+        monkeypatch.setattr(pool, "apply_async", recording_apply_async)
+        blocks = list(datagen.stream_blocks(pool, range(20), 4, ordered))
+
+    assert list(range(20)) == (blocks if ordered else sorted(blocks))
+    assert [not ordered] * 20 == callbacks
+
+
+@pytest.mark.parametrize("compression, extension, open_function", [
+    ("gzip", ".jsonl.gz", gzip.open), ("bz2", ".jsonl.bz2", bz2.open), ("xz", ".jsonl.xz", lzma.open)])
+def test_compressed_files(dict_data_schema, compression, extension, open_function):
+    tmp_dir = tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=300, chunk_lines=1000, compression=compression, compression_level=1)
+    files_to_create = datagen.create_file_names(2, "data", "count", datagen.output_extension(options))
+
+    # one file created by a single process, one merged from compressed chunks
+    datagen.create_files(files_to_create[:1], tmp_dir.name, compiled_schema, 2500, 1, options)
+    datagen.create_files(files_to_create[1:], tmp_dir.name, compiled_schema, 2500, 2, options)
+    assert ["data1" + extension, "data2" + extension] == sorted(os.listdir(tmp_dir.name))
+
+    for file in os.listdir(tmp_dir.name):
+        with open_function(os.path.join(tmp_dir.name, file), 'rt') as output_file:
+            lines = output_file.read().splitlines()
+        assert 2500 == len(lines)
+        for line in lines:
+            check_values_in_output_file(dict_data_schema, json.loads(line))
+
+    sys.argv = ['datagen', tmp_dir.name, '--clear_path', '--file_name=data', '--files_count=1',
+                '--compression=' + compression]
+    datagen.main()
+    assert ["data" + extension] == os.listdir(tmp_dir.name)
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_csv_format(dict_data_schema, engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    tmp_dir = tempfile.TemporaryDirectory()
+    # lists, dicts and booleans of the choices are written as json
+    compiled_schema = datagen.compile_data_schema({**dict_data_schema,
+                                                   "nested": "int:[[1, 2], {'a': None}, True, 'c']"})
+    options = datagen.OutputOptions(engine=engine, batch_size=300, chunk_lines=1000, file_format="csv")
+    datagen.create_files(["data.csv"], tmp_dir.name, compiled_schema, 2500, 2, options)
+    assert ["data.csv"] == os.listdir(tmp_dir.name)
+
+    with open(os.path.join(tmp_dir.name, "data.csv"), 'r', newline='') as output_file:
+        rows = list(csv.reader(output_file))
+    assert list(dict_data_schema.keys()) + ["nested"] == rows[0]
+    assert 2501 == len(rows)
+    assert {'[1, 2]', '{"a": null}', "true", "c"} == {row[-1] for row in rows[1:]}
+    for row in rows[1:]:
+        output_dict = dict(zip(rows[0], row))
+        assert output_dict["str_list"] in ["a", "b"]
+        assert 0 <= int(output_dict["int_rand_range"]) <= 99
+        assert "" == output_dict["int_empty"]
+        UUID(output_dict["str_rand"], version=4)
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_npz_format(dict_data_schema, engine):
+    np = pytest.importorskip("numpy")
+    tmp_dir = tempfile.TemporaryDirectory()
+    sys.argv = ['datagen', tmp_dir.name, '--data_schema=' + json.dumps(dict_data_schema), '--file_name=data',
+                '--files_count=1', '--data_lines=250', '--batch_size=100', '--format=npz', '--engine=' + engine]
+    datagen.main()
+
+    with np.load(os.path.join(tmp_dir.name, "data.npz")) as npz_file:
+        assert npz_file["int_rand"].dtype == np.int64
+        assert npz_file["int_list"].dtype == np.int64
+        assert npz_file["int_empty"].dtype == np.float64 and np.isnan(npz_file["int_empty"]).all()
+        assert npz_file["str_rand"].dtype.kind == "U"
+        assert {"a", "b"} >= set(npz_file["str_list.categories"][npz_file["str_list"]])
+        assert (npz_file["str_val"] == "a1b2").all()
+        for key in dict_data_schema:
+            assert 250 == len(npz_file[key])
+
+
+@pytest.mark.parametrize("engine, file_format, compression", [
+    ("python", "jsonl", "none"), ("python", "csv", "gzip"), ("numpy", "jsonl", "none"), ("numpy", "npz", "none")])
+def test_seed_gives_the_same_output(dict_data_schema, engine, file_format, compression):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(engine=engine, batch_size=300, chunk_lines=1000, file_format=file_format,
+                                    compression=compression, seed=42)
+    files_to_create = datagen.create_file_names(3, "data", "uuid", datagen.output_extension(options), options.seed)
+    assert files_to_create == datagen.create_file_names(3, "data", "uuid", datagen.output_extension(options), 42)
+
+    outputs = []
+    for num_of_processes in [1, 2]:
+        tmp_dir = tempfile.TemporaryDirectory()
+        datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 2500, num_of_processes, options)
+        output = {}
+        for file in sorted(os.listdir(tmp_dir.name)):
+            with open(os.path.join(tmp_dir.name, file), 'rb') as output_file:
+                output[file] = output_file.read()
+        outputs.append(output)
+
+    assert sorted(files_to_create) == sorted(outputs[0].keys())
+    assert outputs[0] == outputs[1]
+    assert len(set(outputs[0].values())) == 3
+
+
+def test_bulk_uuids():
+    uuids = datagen.bulk_uuids(datagen.random.Random(0).getrandbits, 1000)
+    assert len(set(uuids)) == 1000
+    for value in uuids:
+        assert str(UUID(value, version=4)) == value
+
+    np = pytest.importorskip("numpy")
+    for quoted in [False, True]:
+        uuids = datagen.numpy_bulk_uuids(np.random.default_rng(0), 1000, quoted)
+        assert len(set(uuids)) == 1000
+        for value in uuids:
+            value = json.loads(value) if quoted else value
+            assert str(UUID(value, version=4)) == value
+
+
+def test_random_suffixes_are_unique():
+    files_to_create = datagen.create_file_names(9999, "data", "random")
+    assert 9999 == len(set(files_to_create))
+    assert datagen.create_file_names(9999, "data", "random", seed=3) == \
+        datagen.create_file_names(9999, "data", "random", seed=3)
+
+
+def test_shard_dirs():
+    tmp_dir = tempfile.TemporaryDirectory()
+    sys.argv = ['datagen', tmp_dir.name, '--files_count=40', '--file_name=data', '--data_lines=1', '--shard_dirs=4']
+    datagen.main()
+    assert ["0", "1", "2", "3"] == sorted(os.listdir(tmp_dir.name))
+    files = [file for shard_dir in os.listdir(tmp_dir.name)
+             for file in os.listdir(os.path.join(tmp_dir.name, shard_dir))]
+    assert 40 == len(files)
+    assert all(len(os.listdir(os.path.join(tmp_dir.name, shard_dir))) < 40 for shard_dir in os.listdir(tmp_dir.name))
+
+    sys.argv = ['datagen', tmp_dir.name, '--files_count=40', '--file_name=data', '--data_lines=1', '--shard_dirs=4',
+                '--clear_path']
+    datagen.main()
+    files = [file for shard_dir in os.listdir(tmp_dir.name)
+             for file in os.listdir(os.path.join(tmp_dir.name, shard_dir))]
+    assert 40 == len(files)
+
+
+def test_clear_path_matches_file_name_literally():
+    tmp_dir = tempfile.TemporaryDirectory()
+    names = ["d.t1.jsonl", "d.t2.csv.gz", ".d.t3.jsonl.part0", "data4.jsonl", "d.t5.jsonl.txt", "xd.t6.jsonl"]
+    for name in names:
+        open(os.path.join(tmp_dir.name, name), 'w').close()
+
+    assert 3 == datagen.clear.clear_path(tmp_dir.name, "d.t", datagen.OUTPUT_EXTENSIONS, 2)
+    assert ["d.t5.jsonl.txt", "data4.jsonl", "xd.t6.jsonl"] == sorted(os.listdir(tmp_dir.name))
+
+
+def test_clear_path_in_background():
+    tmp_dir = tempfile.TemporaryDirectory()
+    for i in range(1, 2001):
+        open(os.path.join(tmp_dir.name, 'data' + str(i) + '.jsonl'), 'w').close()
+        open(os.path.join(tmp_dir.name, 'data' + str(i) + '.jsonl.stats.json'), 'w').close()
+    open(os.path.join(tmp_dir.name, 'data1.txt'), 'w').close()
+
+    # statistics of the files created again are new ones, not removed by the background thread
+    sys.argv = ['datagen', tmp_dir.name, '--clear_path', '--clear_in_background', '--clear_threads=4',
+                '--file_name=data', '--files_count=5', '--suffix=count', '--data_lines=3', '--stats']
+    datagen.main()
+    assert sorted(["data1.txt", "datagen_stats.json"] + [f"data{i}.jsonl{suffix}" for i in range(1, 6)
+                                                        for suffix in ["", ".stats.json"]]) == \
+        sorted(os.listdir(tmp_dir.name))
+    for i in range(1, 6):
+        with open(os.path.join(tmp_dir.name, f"data{i}.jsonl.stats.json")) as stats_file:
+            assert 3 == json.load(stats_file)["rows"]
+
+    open(os.path.join(tmp_dir.name, 'data9.jsonl.stats.json'), 'w').close()
+    now, later = datagen.clear.split_removal(tmp_dir.name, "data", datagen.OUTPUT_EXTENSIONS, ["data1.jsonl"])
+    assert [os.path.join(tmp_dir.name, name) for name in ["data1.jsonl", "data1.jsonl.stats.json"]] == sorted(now)
+    assert os.path.join(tmp_dir.name, "data9.jsonl.stats.json") in later
+    for i in range(1, 6):
+        with open(os.path.join(tmp_dir.name, 'data' + str(i) + '.jsonl'), 'r') as output_file:
+            assert 3 == len(output_file.read().splitlines())
+
+
+def test_dispatch_chunksize():
+    assert 1 == datagen.dispatch_chunksize(10, 1000000, 4)
+    assert 62 == datagen.dispatch_chunksize(1000, 100, 4)
+    assert 1000 == datagen.dispatch_chunksize(1000000, 100, 4)
+
+
+def test_auto_multiprocessing(caplog, dict_data_schema):
+    caplog.set_level(logging.INFO)
+    tmp_dir = tempfile.TemporaryDirectory()
+    sys.argv = ['datagen', tmp_dir.name, '--data_schema=' + json.dumps(dict_data_schema), '--files_count=3',
+                '--data_lines=10', '--multiprocessing=auto']
+    datagen.main()
+    assert "using 1 processes" in caplog.text
+    assert 3 == len(os.listdir(tmp_dir.name))
+
+    sys.argv = ['datagen', tmp_dir.name, '--multiprocessing=many']
+    with pytest.raises(SystemExit):
+        datagen.main()
+
+
+@pytest.mark.parametrize("file_format, num_of_processes", [("jsonl", 1), ("jsonl", 2), ("csv", 2), ("npz", 2)])
+def test_metrics(dict_data_schema, file_format, num_of_processes):
+    if file_format == "npz":
+        pytest.importorskip("numpy")
+    tmp_dir = tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=300, chunk_lines=1000, file_format=file_format)
+    files_to_create = datagen.create_file_names(3, "data", "count", datagen.output_extension(options))
+    counters = datagen.metrics.create_counters(num_of_processes)
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 2500, num_of_processes, options, counters)
+
+    metrics_path = os.path.join(tmp_dir.name, "metrics.json")
+    datagen.metrics.write_metrics(metrics_path, counters)
+    with open(metrics_path) as metrics_file:
+        summary = json.load(metrics_file)
+    assert 3 * 2500 == summary["rows"]
+    assert 3 == summary["files"]
+    assert 0 < summary["bytes"]
+    assert num_of_processes == len(summary["workers"])
+    assert summary["rows"] == summary["main_process"]["rows"] + sum(worker["rows"] for worker in summary["workers"])
+
+
+@pytest.mark.parametrize("mode, report, expected", [
+    ("cpu", "datagen_profile_cpu.txt", "create_file_with_data"), ("mem", "datagen_profile_mem.txt", "datagen.py")])
+def test_profile(dict_data_schema, mode, report, expected):
+    tmp_dir = tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=300, profile=mode)
+    files_to_create = datagen.create_file_names(3, "data", "count")
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 1000, 2, options)
+    datagen.profile.write_report(tmp_dir.name, mode)
+
+    assert report in os.listdir(tmp_dir.name)
+    assert datagen.profile.STATS_DIR not in os.listdir(tmp_dir.name)
+    with open(os.path.join(tmp_dir.name, report)) as report_file:
+        assert expected in report_file.read()
+
+
+def test_benchmark_regressions(monkeypatch):
+    create_files, written = datagen.create_files, {}
+
+    def counting_create_files(files_to_create, path, compiled_schema, data_lines, num_of_processes, *args):
+        written[num_of_processes] = len(files_to_create) * data_lines
+        return create_files(files_to_create, path, compiled_schema, data_lines, num_of_processes, *args)
+
+    monkeypatch.setattr(datagen, "create_files", counting_create_files)
+    results = datagen_benchmark.run_benchmarks(200, 2, 1, datagen.OutputOptions())
+    # the speed of N processes is counted from the lines they have really written
+    assert {1: 200, 2: 400} == written
+    assert [200, 400] == [results[f"create_files/wide/{processes}_processes"]["rows"] for processes in [1, 2]]
+    assert {"create_data_line/wide", "create_file_with_data/str_rand", "create_files/wide/2_processes"} <= set(results)
+    assert all(result["rows_per_second"] > 0 and result["megabytes_per_second"] > 0 for result in results.values())
+
+    baseline = {name: dict(result, rows_per_second=result["rows_per_second"] * 2) for name, result in results.items()}
+    assert [] == datagen_benchmark.compare(results, results, 10)
+    assert len(results) == len(datagen_benchmark.compare(results, baseline, 10))
+    assert [] == datagen_benchmark.compare(results, baseline, 60)
+
+
+def test_background_writer(dict_data_schema):
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    outputs = []
+    for write_queue, fsync in [(0, False), (1, True), (4, False)]:
+        tmp_dir = tempfile.TemporaryDirectory()
+        options = datagen.OutputOptions(batch_size=100, chunk_lines=1000, compression="gzip", seed=1,
+                                        write_queue=write_queue, write_buffer=4096, fsync=fsync)
+        datagen.create_file_with_data("data.jsonl.gz", tmp_dir.name, compiled_schema, 2500, options)
+        with gzip.open(os.path.join(tmp_dir.name, "data.jsonl.gz"), "rt") as output_file:
+            outputs.append(output_file.read())
+    assert 2500 == len(outputs[0].splitlines())
+    assert outputs[0] == outputs[1] == outputs[2]
+
+    def fail(block):
+        raise OSError("No space left on device")
+
+    # an error of the writer thread comes out of the code creating the data
+    with pytest.raises(OSError):
+        with datagen.background_writer(1) as submit:
+            for _ in range(10):
+                submit(fail, b"")
+
+    # a single thread writes all files, also the ones after an error
+    threads = []
+    for _ in range(3):
+        with datagen.background_writer(1) as submit:
+            submit(lambda: threads.append(threading.get_ident()))
+    assert 3 == len(threads) and 1 == len(set(threads)) and threading.get_ident() not in threads
+
+
+def test_library_api(dict_data_schema):
+    rows = datagen.iter_rows(json.dumps(dict_data_schema), 1500, seed=3)
+    assert not isinstance(rows, list)
+    rows = list(rows)
+    assert 1500 == len(rows)
+    for row in rows:
+        check_values_in_output_file(dict_data_schema, row)
+    assert rows == list(datagen.iter_rows(dict_data_schema, 1500, seed=3))
+
+    batches = list(datagen.iter_batches(dict_data_schema, 1500, batch_size=400))
+    assert [400, 400, 400, 300] == [len(batch["int_rand_range"]) for batch in batches]
+    assert set(dict_data_schema) == set(batches[0])
+
+    text_file, binary_file = io.StringIO(), io.BytesIO()
+    assert 700 == datagen.write_jsonl(dict_data_schema, 700, text_file, seed=1, batch_size=300)
+    assert 700 == datagen.write_jsonl(dict_data_schema, 700, binary_file, seed=1, batch_size=300)
+    assert 700 == len(binary_file.getvalue().splitlines())
+    for line in text_file.getvalue().splitlines():
+        check_values_in_output_file(dict_data_schema, json.loads(line))
+
+    with pytest.raises(datagen.exc.IncorrectSchema):
+        datagen.iter_rows("[1, 2]", 10)
+    with pytest.raises(datagen.exc.NonexistentSchemaFile):
+        datagen.iter_batches("missing.json", 10)
+    with pytest.raises(datagen.exc.ValueNegative):
+        datagen.write_jsonl(dict_data_schema, -1, io.StringIO())
+
+
+@pytest.mark.parametrize("engines", [datagen.ENGINES, datagen.VALUES_ENGINES])
+def test_numpy_timestamps(engines):
+    pytest.importorskip("numpy")
+    compiled_schema = datagen.compile_data_schema({"t": "timestamp", "i": "int:rand"})
+    start = time.time()
+    create_batch = engines["numpy"](compiled_schema, datagen.OutputOptions(engine="numpy"))
+    values = []
+    for _ in range(3):
+        batch = create_batch(50000)
+        if isinstance(batch, str):
+            values.extend(json.loads(line)["t"] for line in batch.splitlines())
+        else:
+            values.extend(batch[0].tolist())
+    # the clock is read once per batch, but the rows of a batch still go up with the time they were created in
+    assert 150000 == len(values)
+    assert start <= values[0] and values[-1] <= time.time()
+    assert all(previous <= value for previous, value in zip(values, values[1:]))
+    assert len(set(values)) > 3
+
+
+def test_weighted_choices():
+    weights = {"US": 0.6, "DE": 0.1, "FR": 0.1, "PL": 0.15, "UA": 0.05, "never": 0}
+    probability, alias = datagen.alias_table(list(weights.values()))
+    # every choice gets back exactly its share of the weights from the alias table
+    for index, weight in enumerate(weights.values()):
+        share = probability[index] + sum(1 - probability[other] for other in range(len(weights))
+                                         if alias[other] == index and other != index)
+        assert share / len(weights) == pytest.approx(weight / sum(weights.values()))
+
+    data_schema = {"country": "str:" + str(weights), "size": "int:{1: 3, 2: 1}"}
+    rows = list(datagen.iter_rows(data_schema, 20000, seed=5))
+    for row in rows[:100]:
+        check_values_in_output_file(data_schema, row)
+    check_distribution([row["country"] for row in rows], weights)
+    check_distribution([row["size"] for row in rows], {1: 3, 2: 1})
+
+    if datagen.np is not None:
+        batch = next(datagen.iter_batches(data_schema, 20000, batch_size=20000, seed=5, engine="numpy"))
+        check_distribution(list(batch["country"]), weights)
+        lines = io.StringIO()
+        datagen.write_jsonl(data_schema, 1000, lines, engine="numpy")
+        for line in lines.getvalue().splitlines():
+            check_values_in_output_file(data_schema, json.loads(line))
+
+    for wrong_weights in ["{'a': -1}", "{'a': 0}", "{'a': 'b'}", "{'a': 1, 'b': None}"]:
+        with pytest.raises(datagen.exc.WrongListOfChoices):
+            datagen.compile_data_schema({"key": "str:" + wrong_weights})
+
+
+@pytest.mark.parametrize("engine, file_format", [("python", "jsonl"), ("python", "csv"), ("numpy", "jsonl"),
+                                                 ("numpy", "npz")])
+def test_sequence_columns(engine, file_format):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    data_schema = {"id": "int:seq(1000, 2)", "time": "timestamp:range(1700000000, 0.5, 0.25)",
+                   "exact_time": "timestamp:range(10)"}
+    compiled_schema = datagen.compile_data_schema(data_schema)
+    options = datagen.OutputOptions(engine=engine, batch_size=300, chunk_lines=1000, file_format=file_format)
+    tmp_dir = tempfile.TemporaryDirectory()
+    # chunks of the files are created by different processes, the values still go on from one chunk to the next one
+    files_to_create = datagen.create_file_names(2, "data", "count", datagen.output_extension(options))
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 2500, 2, options)
+
+    for file in files_to_create:
+        if file_format == "npz":
+            with datagen.np.load(os.path.join(tmp_dir.name, file)) as npz_file:
+                columns = {key: npz_file[key].tolist() for key in data_schema}
+        else:
+            with open(os.path.join(tmp_dir.name, file)) as output_file:
+                rows = [json.loads(line) for line in output_file] if file_format == "jsonl" \
+                    else list(csv.DictReader(output_file))
+            columns = {key: [ast.literal_eval(row[key]) if file_format == "csv" else row[key] for row in rows]
+                       for key in data_schema}
+
+        assert list(range(1000, 6000, 2)) == columns["id"]
+        assert [10.0 + row for row in range(2500)] == columns["exact_time"]
+        for row, value in enumerate(columns["time"]):
+            assert 1700000000 + row * 0.5 <= value < 1700000000 + row * 0.5 + 0.25
+
+    lines = io.StringIO()
+    datagen.write_jsonl(data_schema, 2500, lines, engine=engine, batch_size=300)
+    assert list(range(1000, 6000, 2)) == [json.loads(line)["id"] for line in lines.getvalue().splitlines()]
+
+    for wrong_value in ["int:seq()", "int:seq(a)", "int:seq(1, 2, 3)", "str:seq(1)",
+                        "timestamp:range(0, 1, 2)", "timestamp:range(0, 1, -1)", "timestamp:range(x)"]:
+        with pytest.raises((datagen.exc.IncorrectValue, datagen.exc.IncorrectType)):
+            datagen.compile_data_schema({"key": wrong_value})
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_unique_columns(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    data_schema = {"id": "int:unique(-500, 9499)", "token": "str:unique"}
+    compiled_schema = datagen.compile_data_schema(data_schema, seed=5)
+    options = datagen.OutputOptions(engine=engine, batch_size=300, chunk_lines=1000, seed=5)
+    tmp_dir = tempfile.TemporaryDirectory()
+    # files and their chunks are created by different processes without sharing any values
+    files_to_create = datagen.create_file_names(4, "data", "count")
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 2500, 2, options)
+
+    rows = []
+    for file in files_to_create:
+        with open(os.path.join(tmp_dir.name, file)) as output_file:
+            rows += [json.loads(line) for line in output_file]
+    assert 10000 == len(rows) == len({row["id"] for row in rows}) == len({row["token"] for row in rows})
+    assert all(-500 <= row["id"] < 9500 and re.fullmatch("[0-9a-f]{16}", row["token"]) for row in rows)
+
+    # both engines give the same values, and the seed gives the same permutation again
+    python_values = datagen.python_values_engine(compiled_schema, options, (1, 0))(100)
+    assert python_values == [column.tolist() for column in datagen.numpy_values_engine(
+        datagen.compile_data_schema(data_schema, seed=5), options, (1, 0))(100)]
+
+    # npz keeps the bare values of both engines, without json quotes
+    if engine == "numpy":
+        npz_options = options._replace(file_format="npz")
+        datagen.create_file_with_data("data.npz", tmp_dir.name, compiled_schema, 100, npz_options, 1)
+        with datagen.np.load(os.path.join(tmp_dir.name, "data.npz")) as npz_file:
+            assert python_values == [npz_file["id"].tolist(), npz_file["token"].tolist()]
+
+    with pytest.raises(datagen.exc.UniqueValuesExhausted):
+        datagen.create_file_with_data("data.jsonl", tmp_dir.name, datagen.compile_data_schema(
+            {"id": "int:unique(1, 10)"}), 11, options)
+    # measuring the speed for --multiprocessing auto doesn't use up the values of the run
+    small_schema = datagen.compile_data_schema({"id": "int:unique(1, 20)"})
+    assert datagen.measure_throughput(small_schema, options, 0.01) > 0
+    sys.argv = ["datagen", tmp_dir.name, "--data_schema=" + json.dumps({"id": "int:unique(1, 20)"}), "--files_count=2",
+                "--data_lines=10", "--multiprocessing=auto", "--file_name=small"]
+    datagen.main()
+
+    with pytest.raises(datagen.exc.IncompatibleOptions):
+        datagen.create_rolling_files(tmp_dir.name, compiled_schema, datagen.file_naming("data", "count"),
+                                     datagen.RollingLimits(100000, 10000, 0), 1, options)
+    for wrong_value in ["int:unique(1)", "int:unique(5, 1)", "int:unique(1, 2, 3)", "str:unique(1, 2)",
+                        "int:unique"]:
+        with pytest.raises((datagen.exc.IncorrectValue, datagen.exc.IncorrectType)):
+            datagen.compile_data_schema({"key": wrong_value})
+
+
+@pytest.mark.parametrize("engine, file_format", [("python", "jsonl"), ("numpy", "jsonl"), ("python", "csv")])
+def test_column_stats(engine, file_format):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    data_schema = {"number": "int:rand(0, 99)", "color": "str:['red', 'green', 'blue']", "missing": "int:",
+                   "id": "str:rand", "list": "str:[[1], [2, 3]]"}
+    compiled_schema = datagen.compile_data_schema(data_schema)
+    options = datagen.OutputOptions(engine=engine, batch_size=300, chunk_lines=1000, file_format=file_format,
+                                    seed=4, stats=True)
+    tmp_dir = tempfile.TemporaryDirectory()
+    # chunks created by different processes have their statistics merged into the ones of the file
+    files_to_create = datagen.create_file_names(2, "data", "count", datagen.output_extension(options))
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 2500, 2, options)
+    datagen.stats.write_run_stats(tmp_dir.name, files_to_create)
+    assert sorted(files_to_create + [file + ".stats.json" for file in files_to_create] + ["datagen_stats.json"]) == \
+        sorted(os.listdir(tmp_dir.name))
+
+    numbers, colors = [], []
+    for file in files_to_create:
+        with open(os.path.join(tmp_dir.name, file)) as output_file:
+            rows = [json.loads(line) for line in output_file] if file_format == "jsonl" \
+                else list(csv.DictReader(output_file))
+        numbers += [int(row["number"]) for row in rows]
+        colors += [row["color"] for row in rows]
+        with open(os.path.join(tmp_dir.name, file + ".stats.json")) as stats_file:
+            assert len(rows) == json.load(stats_file)["rows"]
+
+    with open(os.path.join(tmp_dir.name, "datagen_stats.json")) as stats_file:
+        run_stats = json.load(stats_file)
+    assert 2 == run_stats["files"] and 5000 == run_stats["rows"]
+    number = run_stats["columns"]["number"]
+    assert (min(numbers), max(numbers), 5000) == (number["min"], number["max"], number["count"])
+    assert sum(numbers) / 5000 == pytest.approx(number["mean"])
+    assert (sum((value - number["mean"]) ** 2 for value in numbers) / 5000) ** 0.5 == pytest.approx(number["std"])
+    assert sorted([color, colors.count(color)] for color in set(colors)) == sorted(run_stats["columns"]["color"]["top"])
+    assert 5000 == run_stats["columns"]["missing"]["nulls"] and 0 == run_stats["columns"]["id"]["nulls"]
+    assert {json.dumps(value) for value, _ in run_stats["columns"]["list"]["top"]} == {"[1]", "[2, 3]"}
+
+    # the statistics don't change the data
+    if file_format == "jsonl":
+        plain_lines = datagen.jsonl_format(compiled_schema, options, (1, 2))(500)
+        observed_lines = datagen.jsonl_format(compiled_schema, options, (1, 2),
+                                              datagen.stats.observer(datagen.stats.create_stats(compiled_schema),
+                                                                     compiled_schema))(500)
+        assert plain_lines == observed_lines
+
+    # counts of too many different values are lowered by at most top_error
+    column_stats = datagen.stats.create_stats(compiled_schema)["columns"]["color"]
+    values = [index % 300 for index in range(3000)] + [7] * 500
+    for batch_start in range(0, len(values), 700):
+        datagen.stats.update_column(column_stats, values[batch_start:batch_start + 700])
+    assert len(column_stats["top"]) <= datagen.stats.TOP_VALUES
+    assert 510 - column_stats["top_error"] <= column_stats["top"]["7"] <= 510
+
+
+def test_verify(dict_data_schema):
+    data_schema = {**dict_data_schema, "id": "int:seq(10, 3)", "weighted": "str:{'x': 2, 'y': 1}",
+                   "unique": "int:unique(0, 99999)", "time": "timestamp:range(0, 0.5, 0.25)"}
+    compiled_schema = datagen.compile_data_schema(data_schema)
+    tmp_dir = tempfile.TemporaryDirectory()
+    datagen.create_shard_dirs(tmp_dir.name, 2)
+    files_to_create = datagen.create_file_names(3, "data", "count", shard_dirs=2)
+    datagen.create_files(files_to_create, tmp_dir.name, compiled_schema, 3000, 2)
+    datagen.create_file_with_data("data.jsonl.gz", tmp_dir.name, compiled_schema, 1000,
+                                  datagen.OutputOptions(compression="gzip"))
+
+    # small parts of the files are checked by different processes, every line exactly once
+    file_paths = datagen.verify.find_files([tmp_dir.name])
+    assert 4 == len(file_paths)
+    result = datagen.verify.verify_files(file_paths, compiled_schema, 2, 10000)
+    assert {"files": 4, "lines": 10000, "violations": 0, "sample": []} == result
+
+    first_file = os.path.join(tmp_dir.name, files_to_create[0])
+    with open(first_file) as output_file:
+        lines = output_file.readlines()
+    bad_rows = [{**json.loads(lines[0]), "int_rand_range": 100}, {**json.loads(lines[1]), "str_list": "c"},
+                {**json.loads(lines[2]), "id": 11}, {**json.loads(lines[3]), "extra": 1}]
+    with open(first_file, "w") as output_file:
+        output_file.writelines(lines[:1000] + [json.dumps(row) + "\n" for row in bad_rows] + ["not json\n"] +
+                               lines[1000:])
+    result = datagen.verify.verify_files(file_paths, compiled_schema, 2, 10000, sample=3)
+    assert (10005, 5, 3) == (result["lines"], result["violations"], len(result["sample"]))
+    assert ["int_rand_range", "str_list", "id"] == [violation["key"] for violation in result["sample"]]
+    assert len("".join(lines[:1000])) == result["sample"][0]["offset"]
+
+    sys.argv = ["datagen", "verify", tmp_dir.name, "--data_schema=" + json.dumps(data_schema), "--block_bytes=20K"]
+    with pytest.raises(SystemExit):
+        datagen.main()
+    sys.argv = ["datagen", "verify", os.path.join(tmp_dir.name, files_to_create[1]),
+                "--data_schema=" + json.dumps(data_schema)]
+    datagen.main()
+
+
+def test_faker_columns(dict_data_schema):
+    pytest.importorskip("faker")
+    tmp_dir = tempfile.TemporaryDirectory()
+    faker_options = datagen.faker_pools.FakerOptions(pool_size=50, seed=7, cache_dir=tmp_dir.name)
+    data_schema = {"name": "faker:name", "email": "faker:email", "date": "faker:date_object"}
+    compiled_schema = datagen.compile_data_schema(data_schema, faker_options)
+    datagen.faker_pools.prepare_pools(compiled_schema)
+    assert 3 == len(os.listdir(tmp_dir.name))
+
+    pool = datagen.faker_pools.value_pool(compiled_schema[0].value)
+    columns = datagen.python_values_engine(compiled_schema, datagen.OutputOptions(), (0, 0))(1000)
+    rows = [dict(zip(data_schema, values)) for values in zip(*columns)]
+    # a pool of 50 values gives at most 50 different ones, all of them taken from the pool
+    assert set(row["email"] for row in rows) <= set(datagen.faker_pools.value_pool(compiled_schema[1].value))
+    assert len(set(row["email"] for row in rows)) <= 50
+    assert all(isinstance(row["date"], str) for row in rows)
+
+    # the same seed gives the same pool, and it's read back from the cache
+    datagen.faker_pools._pools.clear()
+    assert pool == datagen.faker_pools.value_pool(compiled_schema[0].value)
+    assert pool == datagen.faker_pools.create_pool(compiled_schema[0].value)
+
+    if datagen.np is not None:
+        lines = datagen.create_data_batch(compiled_schema, 500, datagen.np.random.default_rng(0))
+        assert all(json.loads(line)["name"] in pool for line in lines.splitlines())
+
+    for wrong_provider in ["", "no_such_provider", "_Faker__config", "name()", "add_provider", "seed", "format",
+                           "enum"]:
+        with pytest.raises(datagen.exc.IncorrectValue):
+            datagen.compile_data_schema({"key": "faker:" + wrong_provider})
+    with pytest.raises(datagen.exc.IncorrectValue):
+        datagen.compile_data_schema({"key": "faker:name"}, datagen.faker_pools.FakerOptions(locale="xx_XX"))
+
+
+def test_resume(monkeypatch, dict_data_schema):
+    tmp_dir, full_run_dir = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+    arguments = ['--data_schema=' + json.dumps(dict_data_schema), '--files_count=5', '--data_lines=100',
+                 '--multiprocessing=1', '--suffix=random', '--seed=3']
+    sys.argv = ['datagen', full_run_dir.name] + arguments
+    datagen.main()
+    assert not os.path.exists(datagen.manifests.manifest_path(full_run_dir.name))
+
+    create_file_with_data = datagen.create_file_with_data
+    created = []
+
+    def killed_after_two_files(*args):
+        if len(created) == 2:
+            raise KeyboardInterrupt
+        created.append(args[0])
+        return create_file_with_data(*args)
+
+    monkeypatch.setattr(datagen, "create_file_with_data", killed_after_two_files)
+    sys.argv = ['datagen', tmp_dir.name] + arguments
+    with pytest.raises(KeyboardInterrupt):
+        datagen.main()
+    assert sorted(created + [datagen.manifests.MANIFEST_NAME]) == sorted(os.listdir(tmp_dir.name))
+    monkeypatch.undo()
+
+    sys.argv = ['datagen', tmp_dir.name, '--resume', '--data_lines=50'] + arguments[:2] + arguments[3:]
+    with pytest.raises(SystemExit):
+        datagen.main()
+
+    sys.argv = ['datagen', tmp_dir.name, '--resume'] + arguments
+    datagen.main()
+    outputs = []
+    for directory in [tmp_dir.name, full_run_dir.name]:
+        output = {}
+        for file in os.listdir(directory):
+            with open(os.path.join(directory, file)) as output_file:
+                output[file] = output_file.read()
+        outputs.append(output)
+    assert 5 == len(outputs[0])
+    assert outputs[0] == outputs[1]
+
+    # the manifest of a finished run is removed, so there's nothing to resume
+    with pytest.raises(SystemExit):
+        datagen.main()
+
+
+def test_resume_chunked_run(monkeypatch, dict_data_schema):
+    tmp_dir, full_run_dir = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(chunk_lines=30, seed=3, file_lines=100)
+    files_to_create = [f"data_{file_index}.jsonl" for file_index in range(5)]
+    settings = datagen.manifests.run_settings(dict_data_schema, 100, options)
+    # a single process creates the chunks in order, so the run is always killed at the same one
+    datagen.create_chunked_files(files_to_create, full_run_dir.name, compiled_schema, 100, 1, options,
+                                 datagen.metrics.create_counters(1))
+
+    create_file_chunk = datagen.create_file_chunk
+
+    def killed_at_fourth_file(file_chunk, *args):
+        if file_chunk[1][0] == 3 and file_chunk[1][1] == 2:
+            raise KeyboardInterrupt
+        return create_file_chunk(file_chunk, *args)
+
+    monkeypatch.setattr(datagen, "create_file_chunk", killed_at_fourth_file)
+    with pytest.raises(KeyboardInterrupt), datagen.manifests.start_manifest(tmp_dir.name, settings,
+                                                                            files_to_create) as manifest:
+        datagen.create_chunked_files(files_to_create, tmp_dir.name, compiled_schema, 100, 1, options,
+                                     datagen.metrics.create_counters(1), manifest=manifest)
+    monkeypatch.undo()
+    # the files finished before the kill are merged and committed
+    assert files_to_create[:3] == sorted(datagen.manifests.read_manifest(tmp_dir.name)[2])
+    assert set(files_to_create[:3]) <= set(os.listdir(tmp_dir.name))
+
+    _, done, manifest = datagen.manifests.resume_manifest(tmp_dir.name, settings)
+    with manifest:
+        datagen.create_chunked_files(files_to_create, tmp_dir.name, compiled_schema, 100, 1, options,
+                                     datagen.metrics.create_counters(1), manifest=manifest, skip=done)
+    datagen.manifests.finish_manifest(tmp_dir.name)
+    outputs = []
+    for directory in [tmp_dir.name, full_run_dir.name]:
+        output = {}
+        for file in os.listdir(directory):
+            with open(os.path.join(directory, file)) as output_file:
+                output[file] = output_file.read()
+        outputs.append(output)
+    assert 5 == len(outputs[0])
+    assert outputs[0] == outputs[1]
+
+
+@pytest.mark.parametrize("num_of_processes, suffix, file_format", [(1, "count", "jsonl"), (2, "random", "csv"),
+                                                                   (2, "uuid", "jsonl")])
+def test_rolling_files(dict_data_schema, num_of_processes, suffix, file_format):
+    tmp_dir = tempfile.TemporaryDirectory()
+    compiled_schema = datagen.compile_data_schema(dict_data_schema)
+    options = datagen.OutputOptions(batch_size=500, chunk_lines=700, file_format=file_format, seed=2)
+    naming = datagen.file_naming("data", suffix, datagen.output_extension(options), options.seed, 2)
+    limits = datagen.RollingLimits(target_bytes=300000, file_bytes=40000, rows_per_file=300)
+    datagen.create_shard_dirs(tmp_dir.name, 2)
+    created_files = datagen.create_rolling_files(tmp_dir.name, compiled_schema, naming, limits, num_of_processes,
+                                                 options)
+
+    sizes = {this_file_name: os.path.getsize(os.path.join(tmp_dir.name, this_file_name))
+             for this_file_name, _ in created_files}
+    assert len(created_files) == len(sizes) == sum(len(os.listdir(os.path.join(tmp_dir.name, shard_dir)))
+                                                   for shard_dir in os.listdir(tmp_dir.name))
+    # every process can go over the target by at most a single batch
+    assert 300000 <= sum(sizes.values()) < 300000 + num_of_processes * 500 * 200
+    for this_file_name, lines in created_files:
+        assert 0 < lines <= 300
+        assert this_file_name.startswith(datagen.shard_dir_name(os.path.basename(this_file_name), 2))
+        with open(os.path.join(tmp_dir.name, this_file_name)) as output_file:
+            assert lines == len(output_file.readlines()) - (file_format == "csv")
+
+    if suffix == "count":
+        assert sorted(os.path.basename(this_file_name) for this_file_name, _ in created_files) == \
+            sorted(f"data{index}.jsonl" for index in range(1, len(created_files) + 1))
+
+
+def test_rolling_limits(caplog):
+    tmp_dir = tempfile.TemporaryDirectory()
+    # one of the limits of a file is needed to split the output into files
+    sys.argv = ['datagen', tmp_dir.name, '--target_bytes=1M', '--file_bytes=0', '--rows_per_file=0']
+    with pytest.raises(SystemExit):
+        datagen.main()
+    assert "--target_bytes can't be used together with --file_bytes 0 and --rows_per_file 0" in caplog.text
+    assert not os.listdir(tmp_dir.name)
+
+
+def test_lazy_file_names():
+    naming = datagen.file_naming("data", "random", ".jsonl", seed=1)
+    names = [datagen.lazy_file_name(naming, file_index) for file_index in range(20000)]
+    assert len(set(names)) == 20000
+    assert names == [datagen.lazy_file_name(datagen.file_naming("data", "random", ".jsonl", seed=1), file_index)
+                     for file_index in range(20000)]
+    assert "data1.jsonl" == datagen.lazy_file_name(datagen.file_naming("data", "count"), 0)
+    assert [1000, 256 * 2 ** 20, 2 * 2 ** 40, int(1.5 * 2 ** 10)] == \
+        [datagen.size_type(size) for size in ["1000", "256M", "2t", "1.5K"]]
+    with pytest.raises(ValueError):
+        datagen.size_type("5X")